@@ -18,7 +18,6 @@
 
 import os
 import sys
-import gzip
 import apt_pkg
 import subprocess
 import shutil
@@ -27,6 +26,9 @@ from apt_pkg import TagFile, TagSection
 from optparse import OptionParser
 from rapidumo.pkginfo import *
 from rapidumo.config import *
+from rapidumo.indexfile import iter_index_sections
+from rapidumo.binaryindex import parse_source_field
+from rapidumo.debversion import version_key
 
 #REPO_POOL ="http://archive.tanglu.org/tanglu/pool"
 REPO_POOL = "file:///srv/dak/ftp/tanglu/pool"
@@ -120,26 +122,10 @@ class Autorebuild():
         return True
 
     def batch_rebuild_packages(self, component, bad_depends, build_note, dry_run=True):
-        source_path = self._archivePath + "/%s/dists/%s/%s/binary-i386/Packages.gz" % ("tanglu", self._suite, component)
-        f = gzip.open(source_path, 'rb')
-        tagf = TagFile (f)
-        rebuildSources = []
+        source_path = self._archivePath + "/%s/dists/%s/%s/binary-i386/Packages" % ("tanglu", self._suite, component)
         bad_depends = bad_depends.strip()
-        for section in tagf:
-            pkgname = section['Package']
-            source_pkg = section.get('Source', '')
-            if source_pkg == '':
-                source_pkg = pkgname
-            if "(" in source_pkg:
-                source_pkg = source_pkg.split("(")[0].strip()
-            if source_pkg in rebuildSources:
-                continue # we already handled a rebuild for that
-            # old binary packages are not interesting for us
-            if source_pkg in self._pkgs_tanglu:
-                compare = version_compare(self._pkgs_tanglu[source_pkg].version, section['Version'])
-                if compare > 0:
-                    continue
-
+        candidates = []
+        for section in iter_index_sections(source_path):
             depends = section.get('Depends', '')
             if depends == '':
                 continue
@@ -149,14 +135,25 @@ class Autorebuild():
                 dep = dep.strip()
                 if dep.startswith(bad_depends):
                     if dep == bad_depends:
-                        rebuildSources.append(source_pkg)
-                        continue
+                        candidates.append(section)
+                        break
                     if '(' not in dep:
                         continue
                     depid_parts = dep.split('(')
                     if bad_depends == depid_parts[0].strip():
-                        rebuildSources.append(source_pkg)
-                        continue
+                        candidates.append(section)
+                        break
+
+        rebuildSources = []
+        for section in candidates:
+            source_pkg, source_version = parse_source_field(section.get('Source'), section['Package'], section['Version'])
+            if source_pkg in rebuildSources:
+                continue # we already handled a rebuild for that
+            # old binary packages are not interesting for us
+            if source_pkg in self._pkgs_tanglu:
+                if version_key(self._pkgs_tanglu[source_pkg].version) > version_key(section['Version']):
+                    continue
+            rebuildSources.append(source_pkg)
 
         print("Packages planned for rebuild:")
         if len(rebuildSources) == 0:
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2016 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sqlite3
+from .config import RapidumoConfig
+from .indexfile import find_index, iter_index_sections
+from .binaryindex import parse_source_field
+from .builddeps import parse_relations, relation_names
+from .pkginfo import PackageInfo, find_dsc
+from .metrics import span, count
+
+# bump this if the schema changes, the database is recreated then
+ARCHIVE_DB_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE indices (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    suite TEXT NOT NULL,
+    component TEXT NOT NULL,
+    arch TEXT,
+    fname TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+
+CREATE TABLE sources (
+    id INTEGER PRIMARY KEY,
+    index_path TEXT NOT NULL,
+    suite TEXT NOT NULL,
+    component TEXT NOT NULL,
+    name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    archs TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    dsc TEXT,
+    maintainer TEXT NOT NULL,
+    uploaders TEXT NOT NULL,
+    homepage TEXT,
+    build_depends TEXT NOT NULL,
+    build_depends_indep TEXT NOT NULL,
+    build_conflicts TEXT NOT NULL,
+    build_conflicts_indep TEXT NOT NULL,
+    extra_source_only INTEGER NOT NULL
+);
+CREATE INDEX sources_index_idx ON sources (index_path);
+CREATE INDEX sources_name_idx ON sources (name, suite);
+CREATE INDEX sources_version_idx ON sources (version);
+CREATE INDEX sources_maintainer_idx ON sources (maintainer);
+
+CREATE TABLE uploaders (
+    source_id INTEGER NOT NULL REFERENCES sources (id) ON DELETE CASCADE,
+    uploader TEXT NOT NULL
+);
+CREATE INDEX uploaders_source_idx ON uploaders (source_id);
+CREATE INDEX uploaders_uploader_idx ON uploaders (uploader);
+
+CREATE TABLE build_deps (
+    source_id INTEGER NOT NULL REFERENCES sources (id) ON DELETE CASCADE,
+    package TEXT NOT NULL,
+    conflict INTEGER NOT NULL
+);
+CREATE INDEX build_deps_source_idx ON build_deps (source_id);
+CREATE INDEX build_deps_package_idx ON build_deps (package);
+
+CREATE TABLE binaries (
+    index_path TEXT NOT NULL,
+    suite TEXT NOT NULL,
+    component TEXT NOT NULL,
+    arch TEXT NOT NULL,
+    name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    source TEXT NOT NULL,
+    source_version TEXT NOT NULL,
+    filename TEXT NOT NULL
+);
+CREATE INDEX binaries_index_idx ON binaries (index_path);
+CREATE INDEX binaries_name_idx ON binaries (name, suite);
+CREATE INDEX binaries_source_idx ON binaries (source, suite);
+"""
+
+
+def _split_uploaders(uploaders):
+    # addresses are separated by commas, but names may contain commas as well
+    result = list()
+    for part in uploaders.split(">,"):
+        part = part.strip()
+        if not part:
+            continue
+        if not part.endswith(">"):
+            part += ">"
+        result.append(part)
+    return result
+
+
+def _relation_names(value):
+    return relation_names(parse_relations(value))
+
+
+class ArchiveDB():
+    """
+     An SQLite database of the packages in the archive, filled from the
+     Sources and Packages indices and refreshed whenever one of them changes.
+    """
+
+    def __init__(self, path, timeout=300):
+        self._path = path
+        # update-archive-db refreshes the data in long transactions, other
+        # tools wait for it instead of failing with "database is locked"
+        self._db = sqlite3.connect(path, timeout=timeout)
+        self._db.execute("PRAGMA foreign_keys = ON")
+        self._db.execute("PRAGMA journal_mode = WAL")
+        version = self._db.execute("PRAGMA user_version").fetchone()[0]
+        if version != ARCHIVE_DB_VERSION:
+            self._create_schema()
+
+    def _create_schema(self):
+        with self._db:
+            for table in ("build_deps", "uploaders", "binaries", "sources", "indices"):
+                self._db.execute("DROP TABLE IF EXISTS %s" % (table))
+            self._db.executescript(_SCHEMA)
+            self._db.execute("PRAGMA user_version = %i" % (ARCHIVE_DB_VERSION))
+
+    def close(self):
+        self._db.close()
+
+    def _index_changed(self, path):
+        fname, fmt = find_index(path)
+        st = os.stat(fname)
+        state = (fname, st.st_size, st.st_mtime_ns)
+        row = self._db.execute("SELECT fname, size, mtime_ns FROM indices WHERE path=?", (path,)).fetchone()
+        return row != state, state
+
+    def _store_index_state(self, path, kind, suite, component, arch, state):
+        self._db.execute("INSERT OR REPLACE INTO indices VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (path, kind, suite, component, arch) + state)
+
+    def refresh_sources(self, path, suite, component):
+        """
+         Update the data of a Sources index, if it has changed since the last
+         time we read it. Returns True if the database was updated.
+        """
+        changed, state = self._index_changed(path)
+        if not changed:
+            return False
+
+        with self._db:
+            self._db.execute("DELETE FROM sources WHERE index_path=?", (path,))
+            for section in iter_index_sections(state[0]):
+                uploaders = section.get('Uploaders', '')
+                build_depends = section.get('Build-Depends', '')
+                build_depends_indep = section.get('Build-Depends-Indep', '')
+                build_conflicts = section.get('Build-Conflicts', '')
+                build_conflicts_indep = section.get('Build-Conflicts-Indep', '')
+                cur = self._db.execute("INSERT INTO sources (index_path, suite, component, name, version, archs, directory, "
+                                       "dsc, maintainer, uploaders, homepage, build_depends, build_depends_indep, "
+                                       "build_conflicts, build_conflicts_indep, extra_source_only) "
+                                       "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                       (path, suite, component, section['Package'], section['Version'],
+                                        section['Architecture'], section['Directory'], find_dsc(section['Files']),
+                                        section['Maintainer'], uploaders, section.get('Homepage', None),
+                                        build_depends, build_depends_indep, build_conflicts, build_conflicts_indep,
+                                        section.get('Extra-Source-Only', 'no') == 'yes'))
+                source_id = cur.lastrowid
+                self._db.executemany("INSERT INTO uploaders VALUES (?, ?)",
+                                     [(source_id, u) for u in _split_uploaders(uploaders)])
+                dep_names = _relation_names(build_depends) | _relation_names(build_depends_indep)
+                deps = [(source_id, name, False) for name in dep_names]
+                conflict_names = _relation_names(build_conflicts) | _relation_names(build_conflicts_indep)
+                deps += [(source_id, name, True) for name in conflict_names]
+                self._db.executemany("INSERT INTO build_deps VALUES (?, ?, ?)", deps)
+            self._store_index_state(path, "sources", suite, component, None, state)
+        return True
+
+    def refresh_binaries(self, path, suite, component, arch):
+        """
+         Update the data of a Packages index, if it has changed.
+        """
+        changed, state = self._index_changed(path)
+        if not changed:
+            return False
+
+        def rows():
+            for section in iter_index_sections(state[0]):
+                name = section['Package']
+                version = section['Version']
+                source, source_version = parse_source_field(section.get('Source'), name, version)
+                yield (path, suite, component, section['Architecture'], name, version,
+                       source, source_version, section.get('Filename', ''))
+
+        with self._db:
+            self._db.execute("DELETE FROM binaries WHERE index_path=?", (path,))
+            self._db.executemany("INSERT INTO binaries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows())
+            self._store_index_state(path, "binaries", suite, component, arch, state)
+        return True
+
+    def refresh(self, conf, quiet=False):
+        """
+         Bring the data of all suites of the archive up to date.
+        """
+        archive_path = os.path.join(conf.archive_config['path'], conf.distro_name)
+        updated = 0
+        for suite in conf.suites_config:
+            suite_name = suite['name']
+            components = suite['components'].split(" ")
+            archs = suite['archs'].split(" ") + ["all"]
+            for component in components:
+                spath = archive_path + "/dists/%s/%s/source/Sources" % (suite_name, component)
+                try:
+                    with span("archive-db.refresh-sources"):
+                        if self.refresh_sources(spath, suite_name, component):
+                            updated += 1
+                except FileNotFoundError:
+                    pass
+                for arch in archs:
+                    bpath = archive_path + "/dists/%s/%s/binary-%s/Packages" % (suite_name, component, arch)
+                    try:
+                        with span("archive-db.refresh-binaries"):
+                            if self.refresh_binaries(bpath, suite_name, component, arch):
+                                updated += 1
+                    except FileNotFoundError:
+                        pass
+        count("archive-db.updated-indices", updated)
+        if not quiet:
+            print("Updated %i indices in the archive database." % (updated))
+        return updated
+
+    def _make_package(self, row):
+        (name, version, suite, component, archs, directory, dsc,
+         maintainer, uploaders, homepage, build_depends, build_depends_indep,
+         build_conflicts, build_conflicts_indep, extra_source_only) = row
+        pkg = PackageInfo(name, version, suite, component, archs, directory, dsc)
+        pkg.maintainer = maintainer
+        pkg.comaintainers = uploaders
+        pkg.homepage = homepage
+        pkg.build_depends = build_depends
+        pkg.build_depends_indep = build_depends_indep
+        pkg.build_conflicts = build_conflicts
+        pkg.build_conflicts_indep = build_conflicts_indep
+        pkg.extra_source_only = bool(extra_source_only)
+        return pkg
+
+    _PKG_COLUMNS = ("s.name, s.version, s.suite, s.component, s.archs, s.directory, s.dsc, s.maintainer, "
+                    "s.uploaders, s.homepage, s.build_depends, s.build_depends_indep, s.build_conflicts, "
+                    "s.build_conflicts_indep, s.extra_source_only")
+
+    def get_sources(self, path, suite, component):
+        """
+         Return the PackageInfo objects of a Sources index, refreshing its data first.
+        """
+        self.refresh_sources(path, suite, component)
+        cur = self._db.execute("SELECT %s FROM sources s WHERE s.index_path=? ORDER BY s.id" % (self._PKG_COLUMNS), (path,))
+        return [self._make_package(row) for row in cur]
+
+    # package record fields (see pkginfo.SOURCE_RECORD_FIELDS) and their columns
+    _RECORD_COLUMNS = {
+        'pkgname': 'name',
+        'version': 'version',
+        'archs': 'archs',
+        'directory': 'directory',
+        'dsc': 'dsc',
+        'maintainer': 'maintainer',
+        'comaintainers': 'uploaders',
+        'homepage': 'homepage',
+        'build_depends': 'build_depends',
+        'build_depends_indep': 'build_depends_indep',
+        'build_conflicts': 'build_conflicts',
+        'build_conflicts_indep': 'build_conflicts_indep',
+        'extra_source_only': 'extra_source_only',
+    }
+
+    def iter_records(self, path, suite, component, fields):
+        """
+         Yield (suite, component, field values...) rows of a Sources index,
+         refreshing its data first.
+        """
+        self.refresh_sources(path, suite, component)
+        columns = ", ".join(self._RECORD_COLUMNS[f] for f in fields)
+        cur = self._db.execute("SELECT suite, component, %s FROM sources WHERE index_path=? ORDER BY id" % (columns), (path,))
+        for row in cur:
+            if 'extra_source_only' in fields:
+                row = list(row)
+                pos = 2 + fields.index('extra_source_only')
+                row[pos] = bool(row[pos])
+            yield row
+
+    def find_source(self, name, suite=None, component=None):
+        """
+         Return all versions of a source package, optionally limited to a suite.
+        """
+        query = "SELECT %s FROM sources s WHERE s.name=?" % (self._PKG_COLUMNS)
+        args = [name]
+        if suite:
+            query += " AND s.suite=?"
+            args.append(suite)
+        if component:
+            query += " AND s.component=?"
+            args.append(component)
+        return [self._make_package(row) for row in self._db.execute(query, args)]
+
+    def find_by_maintainer(self, person, suite=None):
+        """
+         Return (suite, name, version) of all sources maintained or co-maintained
+         by person, which may be a name or an email address.
+        """
+        person = person.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        pattern = "%%%s%%" % (person)
+        query = ("SELECT DISTINCT s.suite, s.name, s.version FROM sources s "
+                 "LEFT JOIN uploaders u ON u.source_id = s.id "
+                 "WHERE (s.maintainer LIKE ? ESCAPE '\\' OR u.uploader LIKE ? ESCAPE '\\')")
+        args = [pattern, pattern]
+        if suite:
+            query += " AND s.suite=?"
+            args.append(suite)
+        return self._db.execute(query + " ORDER BY s.suite, s.name", args).fetchall()
+
+    def find_build_rdepends(self, package, suite=None, conflicts=False):
+        """
+         Return (suite, name, version) of all sources which build-depend
+         (or build-conflict) on package.
+        """
+        query = ("SELECT DISTINCT s.suite, s.name, s.version FROM build_deps d "
+                 "JOIN sources s ON s.id = d.source_id WHERE d.package=? AND d.conflict=?")
+        args = [package, conflicts]
+        if suite:
+            query += " AND s.suite=?"
+            args.append(suite)
+        return self._db.execute(query + " ORDER BY s.suite, s.name", args).fetchall()
+
+    def find_binaries(self, source, suite=None):
+        """
+         Return (suite, arch, name, version) of all binaries built from source.
+        """
+        query = "SELECT DISTINCT suite, arch, name, version FROM binaries WHERE source=?"
+        args = [source]
+        if suite:
+            query += " AND suite=?"
+            args.append(suite)
+        return self._db.execute(query + " ORDER BY suite, name, arch", args).fetchall()
+
+    def find_binary_source(self, binary, suite=None):
+        """
+         Return (suite, source, source version) for a binary package.
+        """
+        query = "SELECT DISTINCT suite, source, source_version FROM binaries WHERE name=?"
+        args = [binary]
+        if suite:
+            query += " AND suite=?"
+            args.append(suite)
+        return self._db.execute(query + " ORDER BY suite", args).fetchall()
+
+    def execute(self, query, args=()):
+        """
+         Run an arbitrary (read-only) SQL query.
+        """
+        return self._db.execute(query, args).fetchall()
+
+    @staticmethod
+    def from_config(conf):
+        path = conf.general_config.get('archive_db')
+        if not path:
+            return None
+        return ArchiveDB(path, conf.general_config.get('archive_db_timeout', 300))
+
+
+_archive_db = None
+_archive_db_loaded = False
+
+
+def get_archive_db():
+    """
+     Return the archive database configured for this host, or None.
+    """
+    global _archive_db, _archive_db_loaded
+    if not _archive_db_loaded:
+        _archive_db_loaded = True
+        try:
+            _archive_db = ArchiveDB.from_config(RapidumoConfig())
+        except OSError:
+            _archive_db = None
+    return _archive_db
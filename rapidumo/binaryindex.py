@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2016 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+from .indexfile import iter_index_sections
+from .debversion import version_key
+
+
+def parse_source_field(source, pkgname, pkgversion):
+    """
+     Split the Source field of a binary package, e.g. "foo (1.0-1)", into
+     the source package name and version. Binaries without a Source field
+     were built from a source package of the same name and version.
+    """
+    if not source:
+        return pkgname, pkgversion
+    name, sep, version = source.partition("(")
+    if not sep:
+        return source, pkgversion
+    # if source has different version, we cheat and set the binary pkg version
+    # to the source package version
+    return name.rstrip(), version.rstrip(") ").lstrip()
+
+
+def read_binary_index(source_path, arch):
+    """
+     Read a Packages file and return (source, source version, binary, version, filename)
+     tuples for all binaries built for the given architecture.
+    """
+    binaries = list()
+    for section in iter_index_sections(source_path):
+        # make sure we have the right arch (closes bug in installed-detection)
+        if section['Architecture'] != arch:
+            continue
+
+        pkgname = section['Package']
+        pkgversion = section['Version']
+        pkgsource, srcversion = parse_source_field(section.get('Source'), pkgname, pkgversion)
+        binaries.append((pkgsource, srcversion, pkgname, pkgversion, section['Filename']))
+
+    return binaries
+
+
+class BinaryInfo():
+    """
+     A binary package version, the source it was built from and the
+     architectures it is available on.
+    """
+    __slots__ = ('name', 'version', 'source', 'source_version', 'archs', 'filenames')
+
+    def __init__(self, name, version, source, source_version):
+        self.name = name
+        self.version = version
+        self.source = source
+        self.source_version = source_version
+        self.archs = list()
+        self.filenames = list()
+
+    def __str__(self):
+        return "%s (%s) [%s (%s)]" % (self.name, self.version, self.source, self.source_version)
+
+
+class BinaryIndex():
+    """
+     Maps binary packages to the source packages they were built from,
+     and the other way round.
+    """
+
+    def __init__(self):
+        # binary name -> list of BinaryInfo, usually just one
+        self._binaries = dict()
+        # (source, source version) -> list of (binary, arch, filename)
+        self._sources = dict()
+
+    def _add(self, name, version, source, source_version, arch, filename):
+        infos = self._binaries.get(name)
+        if infos is None:
+            infos = self._binaries[name] = list()
+        for info in infos:
+            if info.version == version and info.source == source and info.source_version == source_version:
+                break
+        else:
+            info = BinaryInfo(name, version, sys.intern(source), source_version)
+            infos.append(info)
+        info.archs.append(arch)
+        info.filenames.append(filename)
+
+        src_binaries = self._sources.get((source, source_version))
+        if src_binaries is None:
+            src_binaries = self._sources[(source, source_version)] = list()
+        src_binaries.append((name, arch, filename))
+        return info
+
+    def add_records(self, arch, records):
+        """
+         Add the records read by read_binary_index() for the given architecture.
+        """
+        arch = sys.intern(arch)
+        for source, source_version, name, version, filename in records:
+            self._add(name, version, source, source_version, arch, filename)
+
+    def add_section(self, section):
+        """
+         Add a binary package stanza, returning its BinaryInfo.
+        """
+        name = section['Package']
+        version = section['Version']
+        source, source_version = parse_source_field(section.get('Source'), name, version)
+        return self._add(name, version, source, source_version,
+                         sys.intern(section['Architecture']), section.get('Filename', ''))
+
+    def add_index(self, path, arch):
+        self.add_records(arch, read_binary_index(path, arch))
+
+    def get(self, name):
+        """
+         Return all known versions of a binary package.
+        """
+        return self._binaries.get(name, [])
+
+    def source_of(self, name):
+        """
+         Return the (source, source version) the highest version of the
+         binary package was built from, or None if we don't know it.
+        """
+        infos = self._binaries.get(name)
+        if not infos:
+            return None
+        info = max(infos, key=lambda i: version_key(i.version))
+        return info.source, info.source_version
+
+    def binaries_of(self, source, source_version):
+        """
+         Return the (binary, arch, filename) tuples built from a source package,
+         in the order they were added.
+        """
+        return self._sources.get((source, source_version), [])
+
+    def __contains__(self, name):
+        return name in self._binaries
+
+    def __len__(self):
+        return len(self._binaries)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2016 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import apt_pkg
+from .debversion import version_key
+
+_arch_restriction_re = re.compile(r"\[[^\]]*\]")
+
+
+def parse_relations(value, arch=None):
+    """
+     Parse a Build-Depends style field into a tuple of or-groups, each of
+     them a tuple of (name, version, operator) alternatives.
+     If arch is given, architecture restrictions are evaluated for it,
+     otherwise they are ignored and relations of all architectures are kept.
+    """
+    if not value:
+        return ()
+    if arch:
+        groups = apt_pkg.parse_src_depends(value, architecture=arch)
+    else:
+        # apt would evaluate the restrictions for the host architecture
+        groups = apt_pkg.parse_src_depends(_arch_restriction_re.sub("", value))
+    return tuple(tuple(tuple(alt) for alt in group) for group in groups)
+
+
+def relation_names(relations):
+    """
+     Return the names of all packages mentioned in parsed relations.
+    """
+    names = set()
+    for group in relations:
+        for name, version, op in group:
+            names.add(name)
+    return names
+
+
+def parse_build_relations(pkgs, arch=None):
+    """
+     Parse the build relations of PackageInfo objects, returning
+     (name, version, build-depends, build-conflicts) tuples. The -Indep
+     fields are included, as building arch:all packages needs them as well.
+    """
+    relations = list()
+    for pkg in pkgs:
+        relations.append((pkg.pkgname, pkg.version,
+                          parse_relations(pkg.build_depends, arch) +
+                          parse_relations(pkg.build_depends_indep, arch),
+                          parse_relations(pkg.build_conflicts, arch) +
+                          parse_relations(pkg.build_conflicts_indep, arch)))
+    return relations
+
+
+class BuildDepGraph():
+    """
+     The build-dependencies of all source packages of a suite, with a reverse
+     index from binary package names to the sources needing them for building.
+    """
+
+    def __init__(self):
+        # source name -> (version, build-depends, build-conflicts)
+        self._sources = dict()
+        # binary name -> set of source names, built on demand
+        self._rdepends = None
+        self._rconflicts = None
+
+    def add_relations(self, relations):
+        """
+         Add the result of parse_build_relations(). Only the highest
+         version of every source package is kept.
+        """
+        for name, version, depends, conflicts in relations:
+            known = self._sources.get(name)
+            if known and version_key(known[0]) >= version_key(version):
+                continue
+            self._sources[name] = (version, depends, conflicts)
+        self._rdepends = None
+        self._rconflicts = None
+
+    def _build_reverse_index(self):
+        rdepends = dict()
+        rconflicts = dict()
+        for source, (version, depends, conflicts) in self._sources.items():
+            for name in relation_names(depends):
+                rdepends.setdefault(name, set()).add(source)
+            for name in relation_names(conflicts):
+                rconflicts.setdefault(name, set()).add(source)
+        self._rdepends = rdepends
+        self._rconflicts = rconflicts
+
+    def get_version(self, source):
+        known = self._sources.get(source)
+        return known[0] if known else None
+
+    def get_build_depends(self, source):
+        known = self._sources.get(source)
+        return known[1] if known else ()
+
+    def get_build_conflicts(self, source):
+        known = self._sources.get(source)
+        return known[2] if known else ()
+
+    def build_rdepends(self, binary):
+        """
+         Return the names of all sources which build-depend on the binary
+         package, directly or as one of several alternatives.
+        """
+        if self._rdepends is None:
+            self._build_reverse_index()
+        return sorted(self._rdepends.get(binary, ()))
+
+    def build_rconflicts(self, binary):
+        if self._rconflicts is None:
+            self._build_reverse_index()
+        return sorted(self._rconflicts.get(binary, ()))
+
+    def impact(self, binaries, binary_index=None, recursive=False):
+        """
+         Return the sources affected if the given binary packages change or
+         are removed. With a BinaryIndex and recursive set, sources needing
+         binaries built by affected sources are included as well, e.g. to
+         plan the rebuilds of a transition.
+        """
+        affected = set()
+        todo = list(binaries)
+        seen = set(todo)
+        while todo:
+            binary = todo.pop()
+            for source in self.build_rdepends(binary):
+                if source in affected:
+                    continue
+                affected.add(source)
+                if not recursive or not binary_index:
+                    continue
+                for name, arch, fname in binary_index.binaries_of(source, self.get_version(source)):
+                    if name not in seen:
+                        seen.add(name)
+                        todo.append(name)
+        return affected
+
+    def __contains__(self, source):
+        return source in self._sources
+
+    def __len__(self):
+        return len(self._sources)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2016 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import hashlib
+import pickle
+import tempfile
+from .config import RapidumoConfig
+
+# bump this whenever the layout of cached objects changes, so we never
+# load data written by an incompatible version of rapidumo
+CACHE_FORMAT = 3
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def evict_files(path, suffix, max_size=0, max_age=0):
+    """
+     Remove files ending with suffix from a directory, oldest first, until
+     their total size is below max_size bytes. Files which were not used for
+     more than max_age seconds are always removed.
+    """
+    if not max_size and not max_age:
+        return
+    now = time.time()
+    entries = list()
+    total_size = 0
+    for entry in os.scandir(path):
+        if not entry.name.endswith(suffix):
+            continue
+        try:
+            st = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, entry.path))
+        total_size += st.st_size
+
+    # drop the least recently used entries first
+    entries.sort()
+    for mtime, size, fname in entries:
+        expired = max_age and now - mtime > max_age
+        if not expired and (not max_size or total_size <= max_size):
+            break
+        try:
+            os.unlink(fname)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+
+class CacheDir():
+    """
+     A directory of pickled objects, written atomically and evicted
+     in least-recently-used order once it grows beyond max_size bytes.
+    """
+
+    def __init__(self, path, max_size=0):
+        self._path = path
+        self._max_size = max_size
+        if not os.path.exists(self._path):
+            os.makedirs(self._path)
+
+    @property
+    def path(self):
+        return self._path
+
+    def _entry_path(self, key):
+        fname = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self._path, "%s.pickle" % (fname))
+
+    def load(self, key):
+        fname = self._entry_path(key)
+        try:
+            with open(fname, 'rb') as f:
+                fmt, stored_key, data = pickle.load(f)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+        if fmt != CACHE_FORMAT or stored_key != key:
+            return None
+        # mark the entry as recently used
+        os.utime(fname, None)
+        return data
+
+    def store(self, key, data):
+        fname = self._entry_path(key)
+        fd, tmp_fname = tempfile.mkstemp(dir=self._path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((CACHE_FORMAT, key, data), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_fname, fname)
+        except Exception:
+            os.unlink(tmp_fname)
+            raise
+        self.evict()
+
+    def store_file_data(self, key, path, data):
+        """
+         Store data derived from the file at path, so it can be loaded
+         instead of parsing the file again while the file stays unchanged.
+        """
+        st = os.stat(path)
+        self.store("%s:%s" % (key, os.path.realpath(path)), (st.st_size, st.st_mtime_ns, data))
+
+    def load_file_data(self, key, path):
+        """
+         Return the data stored by store_file_data() for the file at path,
+         or None if there is none or the file has changed since.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        entry = self.load("%s:%s" % (key, os.path.realpath(path)))
+        if entry is None:
+            return None
+        size, mtime, data = entry
+        if size != st.st_size or mtime != st.st_mtime_ns:
+            return None
+        return data
+
+    def remove(self, key):
+        try:
+            os.unlink(self._entry_path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        evict_files(self._path, ".pickle", self._max_size)
+
+
+class IndexCache(CacheDir):
+    """
+     Persistent cache for data parsed from archive index files.
+     Entries are keyed on the index path and validated against its size,
+     mtime and content hash, so only indices which really changed are
+     parsed again.
+    """
+
+    def get(self, kind, path, parse_func):
+        key = "%s:%s" % (kind, os.path.realpath(path))
+        st = os.stat(path)
+
+        entry = self.load(key)
+        if entry is not None:
+            size, mtime, digest, data = entry
+            if size == st.st_size and mtime == st.st_mtime_ns:
+                return data
+            # the file was touched, check if its contents really changed
+            if size == st.st_size and digest == file_digest(path):
+                self.store(key, (st.st_size, st.st_mtime_ns, digest, data))
+                return data
+
+        digest = file_digest(path)
+        data = parse_func(path)
+        self.store(key, (st.st_size, st.st_mtime_ns, digest, data))
+        return data
+
+    @staticmethod
+    def from_config(conf):
+        gcfg = conf.general_config
+        cache_dir = gcfg.get('cache_dir')
+        if not cache_dir:
+            return None
+        # size limit is configured in MiB
+        max_size = gcfg.get('index_cache_max_size', 1024) * 1024 * 1024
+        return IndexCache(os.path.join(cache_dir, "indices"), max_size)
+
+
+def cache_dir_from_config(conf, name, max_size=0):
+    """
+     Return the named cache directory below the configured cache root,
+     or None if caching is disabled.
+    """
+    cache_dir = conf.general_config.get('cache_dir')
+    if not cache_dir:
+        return None
+    return CacheDir(os.path.join(cache_dir, name), max_size)
+
+
+_index_cache = None
+_index_cache_loaded = False
+
+
+def get_index_cache():
+    """
+     Return the index cache configured for this host, or None if
+     caching is disabled.
+    """
+    global _index_cache, _index_cache_loaded
+    if not _index_cache_loaded:
+        _index_cache_loaded = True
+        try:
+            _index_cache = IndexCache.from_config(RapidumoConfig())
+        except OSError:
+            # no rapidumo configuration on this machine
+            _index_cache = None
+    return _index_cache
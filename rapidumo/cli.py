@@ -19,127 +19,297 @@
 
 import os
 import sys
-import codecs
 import re
-import yaml
 import time
+import json
+import html
+import shutil
+import itertools
 from optparse import OptionParser
 
 from .pkginfo import *
 from .utils import *
 from .config import *
+from .dosereport import iter_dose_report
+from .metrics import start_run
+from .cache import cache_dir_from_config
 from .janitor.installability_test import JanitorDebcheck
 
+# the package fields of the debcheck JSON data
+DEBCHECK_DATA_FIELDS = ['source', 'package', 'version', 'architecture', 'issue_type', 'issue_summary']
+
+# identifies the cached data of the debcheck YAML reports, change it
+# whenever the data read by _read_debcheck_issues() changes
+DEBCHECK_CACHE_KEY = "debcheck-issues:1"
+
+# keywords highlighted in the Britney output
+BRITNEY_HIGHLIGHTS = {
+    "accepted: ": "<font color=\"green\">accepted</font>: ",
+    "skipped: ": "<font color=\"orange\">skipped</font>: ",
+    "SUCCESS": "<font color=\"lime\">SUCCESS</font>",
+    "FAILED": "<font color=\"red\">FAILED</font>",
+    "success: ": "<font color=\"lime\">success</font>: ",
+    "failed: ": "<font color=\"red\">failed</font>: ",
+    "Trying force-hint": "Trying <font color=\"indianred\">force-hint</font>",
+}
+_britney_highlight_re = re.compile("|".join(re.escape(k) for k in BRITNEY_HIGHLIGHTS))
+
+
+def highlight_britney_output(text):
+    """
+     Escape Britney output for HTML and highlight its keywords,
+     in a single pass over the text.
+    """
+    text = html.escape(text, quote=False)
+    text = _britney_highlight_re.sub(lambda m: BRITNEY_HIGHLIGHTS[m.group()], text)
+    return text.replace("\n", "<br/>\n")
+
+
+_excuse_start_re = re.compile(r'^<li>\s*<a (?:id|name)="([^"]+)"')
+
+
+def iter_britney_excuses(f):
+    """
+     Read the body of a Britney update_excuses.html line by line, yielding
+     (None, lines) for the HTML before the first excuse, then
+     (package, lines) for every excuse.
+    """
+    in_body = False
+    name = None
+    lines = list()
+    for line in f:
+        if not in_body:
+            pos = line.find("<body>")
+            if pos < 0:
+                continue
+            in_body = True
+            line = line[pos + len("<body>"):]
+        pos = line.find("</body>")
+        if pos >= 0:
+            # the list of all excuses is closed just before the end of the body
+            line = line[:pos].rstrip()
+            if line.endswith("</ul>"):
+                line = line[:-len("</ul>")]
+        m = _excuse_start_re.match(line)
+        if m:
+            if name or lines:
+                yield name, lines
+            name = m.group(1)
+            lines = list()
+        if line:
+            lines.append(line)
+        if pos >= 0:
+            break
+    if name or lines:
+        yield name, lines
+
+
 class RapidumoPageRenderer:
     def __init__(self, suite = ""):
         self._conf = RapidumoConfig()
 
+    def _remove_stale_pages(self, first_page, page_count):
+        """
+         Remove the pages after page_count of a paginated page, which
+         are left over from an earlier, longer version of it.
+        """
+        first_page = get_output_path(first_page, self._conf)
+        prefix = os.path.basename(first_page)[:-len(".html")]
+        page_re = re.compile(r"^%s_(\d+)\.html$" % (re.escape(prefix)))
+        out_dir = os.path.dirname(first_page)
+        for fname in os.listdir(out_dir):
+            m = page_re.match(fname)
+            if m and int(m.group(1)) > page_count:
+                os.unlink(os.path.join(out_dir, fname))
+
+    def _iter_britney_output(self, f, line_count):
+        # highlight blocks of lines, which is a lot faster than doing it line by line
+        while line_count > 0:
+            lines = list(itertools.islice(f, min(line_count, 1000)))
+            if not lines:
+                break
+            line_count -= len(lines)
+            yield highlight_britney_output("".join(lines))
+
     def _render_britney_output(self):
         britney_out = self._conf.general_config['britney_output_dir']
         britney_out = os.path.join(britney_out, "update_output.txt")
-        f = open(britney_out, "r")
-        styled_text = ""
-        for line in f:
-            s = line.replace("accepted: ", "<font color=\"green\">accepted</font>: ")
-            s = s.replace("skipped: ", "<font color=\"orange\">skipped</font>: ")
-            s = s.replace("SUCCESS", "<font color=\"lime\">SUCCESS</font>")
-            s = s.replace("FAILED", "<font color=\"red\">FAILED</font>")
-            s = s.replace("success: ", "<font color=\"lime\">success</font>: ")
-            s = s.replace("failed: ", "<font color=\"red\">failed</font>: ")
-            s = s.replace("Trying force-hint", "Trying <font color=\"indianred\">force-hint</font>")
-
-            styled_text += "%s<br/>" % (s)
-
-        render_template("migrations/britney_output.html", page_name="migrations", britney_result="output",
-                    britney_output=styled_text)
+        page_lines = self._conf.general_config.get('britney_output_page_lines', 20000)
+
+        # count the lines first, so every page knows how many pages there are;
+        # open the file just like below, so both agree on what a line is
+        with open(britney_out, 'r', encoding='utf-8', errors='replace') as f:
+            line_count = sum(1 for line in f)
+        page_count = max((line_count + page_lines - 1) // page_lines, 1)
+        page_urls = ["britney_output.html"]
+        for i in range(2, page_count + 1):
+            page_urls.append("britney_output_%i.html" % (i))
+
+        # the lines are highlighted while the pages are written
+        with open(britney_out, 'r', encoding='utf-8', errors='replace') as f:
+            for i, url in enumerate(page_urls):
+                render_template("migrations/britney_output.html", "migrations/%s" % (url), page_name="migrations",
+                        britney_result="output", britney_output=self._iter_britney_output(f, page_lines),
+                        page_urls=page_urls, page_number=i + 1)
+        self._remove_stale_pages("migrations/britney_output.html", page_count)
 
     def _render_britney_excuses(self):
         britney_exc = self._conf.general_config['britney_output_dir']
         britney_exc = os.path.join(britney_exc, "update_excuses.html")
-        f = codecs.open(britney_exc, 'r', encoding='utf-8')
-        exc_html = f.read()
-        m = re.findall('<body>(.*?)</body>', exc_html, re.DOTALL)
-        exc_html = m[0]
 
+        # every excuse is written to its own fragment, which the index page
+        # loads when it is opened; unchanged excuses are not rewritten
+        header = list()
+        excuses = list()
+        fragments = set()
+        with open(britney_exc, 'r', encoding='utf-8', errors='replace') as f:
+            for name, lines in iter_britney_excuses(f):
+                if not name:
+                    header.extend(lines)
+                    continue
+                # different names may map to the same file name, number those
+                base = re.sub(r"[^\w.+-]", "_", name)
+                fragment = "%s.html" % (base)
+                n = 1
+                while fragment in fragments:
+                    n += 1
+                    fragment = "%s_%i.html" % (base, n)
+                fragments.add(fragment)
+                write_output_file("migrations/excuses/%s" % (fragment), "".join(lines[1:]).encode('utf-8'), self._conf)
+                excuses.append({'name': name, 'summary': lines[0][len("<li>"):], 'fragment': "excuses/%s" % (fragment)})
+
+        excuses_dir = os.path.dirname(get_output_path("migrations/excuses/index", self._conf))
+        for fname in os.listdir(excuses_dir):
+            if fname.endswith(".html") and fname not in fragments:
+                os.unlink(os.path.join(excuses_dir, fname))
+
+        # drop the list britney wraps the excuses in, we make our own
+        header = "".join(header).replace("<ul>", "")
         render_template("migrations/britney_excuses.html", page_name="migrations", britney_result="excuses",
-                    britney_excuses=exc_html)
+                    britney_header=header, excuses=excuses)
 
     def _create_debcheck_yml(self):
         devel_suite = self._conf.archive_config['devel_suite']
         out_dir = self._conf.general_config['pkg_issues_dir']
         jd = JanitorDebcheck()
-        for arch in self._conf.get_supported_archs(devel_suite).split(" "):
+        archs = self._conf.get_supported_archs(devel_suite).split(" ")
+        # check all architectures at once
+        results = jd.run_debcheck(devel_suite, archs)
+        for arch in archs:
+            result = results[arch]
+            if not result.report_file:
+                print("Not updating debcheck data for %s: %s" % (arch, result))
+                continue
             fname = os.path.join(out_dir, "brokenpkg-%s_%s.yml" % (devel_suite, arch))
-            yaml_data = jd.get_debcheck_yaml(devel_suite, arch)
-            yaml_file = open(fname, 'w')
-            yaml_file.write(str(yaml_data, 'utf-8'))
-            yaml_file.close()
+            with result.report_file as report_file:
+                with open(fname, 'wb') as yaml_file:
+                    shutil.copyfileobj(report_file, yaml_file)
+            # parse the report once, the pages load the result from our cache
+            # (never from the published directory, we unpickle that data)
+            report_cache = cache_dir_from_config(self._conf, "reports")
+            if report_cache:
+                report_cache.store_file_data(DEBCHECK_CACHE_KEY, fname, self._read_debcheck_issues(fname))
+
+    def _read_debcheck_issues(self, fname):
+        """
+         Read the broken packages from a dose report, sorted by source package.
+         Every entry keeps the dose reasons, for showing the issue details.
+        """
+        issues = list()
+        with open(fname, 'rb') as f:
+            for report in iter_dose_report(f):
+                if report['status'] == "ok":
+                    continue
+                dose_report = "Unknown problem"
+                issue_type = "unknown"
+                for reason in report["reasons"]:
+                    if "missing" in reason:
+                        dose_report = ("Unsat dependency %s" %
+                            (reason["missing"]["pkg"]["unsat-dependency"]))
+                        issue_type = "pkg-missing"
+                        break
+                    elif "conflict" in reason:
+                        issue_type = "pkg-conflict"
+                        if reason["conflict"].get("pkg2"):
+                            dose_report = ("Conflict between %s and %s" %
+                                    (reason["conflict"]["pkg1"]["package"],
+                                    reason["conflict"]["pkg2"]["package"]))
+                        else:
+                            dose_report = ("Conflict involving %s (%s)" %
+                                    (reason["conflict"]["pkg1"]["package"],
+                                    reason["conflict"]["pkg1"]["version"]))
+                        break
+
+                dose_report = dose_report.replace("%3a", ":") # compatibility with older dose3 releases
+                pkgname = report.get('package', '')
+                if ":" in pkgname:
+                    pkgname = pkgname.split(":")[1]
+
+                # FIXME: Workaround for dose multiarch bug - this dependency is perfectly fine,
+                # but dose detects it as issue.
+                if pkgname == "lib32nss-mdns":
+                    if dose_report.startswith("Unsat dependency amd64:libnss-mdns-i386"):
+                        continue
+
+                info = dict()
+                info['source'] = str(report.get('source', ''))
+                info['package'] = pkgname
+                info['version'] = str(report.get('version', ''))
+                info['architecture'] = report.get('architecture', '')
+                info['issue_summary'] = dose_report
+                info['issue_type'] = issue_type
+                info['reasons'] = report["reasons"]
+                issues.append(info)
+
+        issues.sort(key=lambda i: (i['source'], i['package']))
+        return issues
+
+    def _load_debcheck_issues(self, fname):
+        issues = None
+        report_cache = cache_dir_from_config(self._conf, "reports")
+        if report_cache:
+            issues = report_cache.load_file_data(DEBCHECK_CACHE_KEY, fname)
+        if issues is None:
+            issues = self._read_debcheck_issues(fname)
+        return issues
 
     def _render_debcheck_pages(self):
         devel_suite = self._conf.archive_config['devel_suite']
         out_dir = self._conf.general_config['pkg_issues_dir']
+        page_size = self._conf.general_config.get('debcheck_page_size', 500)
         for arch in self._conf.get_supported_archs(devel_suite).split(" "):
             fname = os.path.join(out_dir, "brokenpkg-%s_%s.yml" % (devel_suite, arch))
             if not os.path.exists(fname):
                 continue
-            f = open(fname, 'r')
-            yaml_data = yaml.safe_load(f.read())
-            f.close()
-
-            pkg_list = list()
-            reports = yaml_data.get('report')
-            if not reports:
-                reports = list()
-            for report in reports:
-                if report['status'] != "ok":
-                    dose_report = "Unknown problem"
-                    issue_type = "unknown"
-                    for reason in report["reasons"]:
-                        if "missing" in reason:
-                            dose_report = ("Unsat dependency %s" %
-                                (reason["missing"]["pkg"]["unsat-dependency"]))
-                            issue_type = "pkg-missing"
-                            break
-                        elif "conflict" in reason:
-                            issue_type = "pkg-conflict"
-                            if reason["conflict"].get("pkg2"):
-                                dose_report = ("Conflict between %s and %s" %
-                                        (reason["conflict"]["pkg1"]["package"],
-                                        reason["conflict"]["pkg2"]["package"]))
-                            else:
-                                dose_report = ("Conflict involving %s (%s)" %
-                                        (reason["conflict"]["pkg1"]["package"],
-                                        reason["conflict"]["pkg1"]["version"]))
-                            break
-
-                    dose_report = dose_report.replace("%3a", ":") # compatibility with older dose3 releases
-                    pkgname = report.get('package', '')
-                    if ":" in pkgname:
-                        pkgname = pkgname.split(":")[1]
-                    dose_details = yaml.dump(report["reasons"], default_flow_style=False, indent=2, width=200)
-                    if dose_details:
-                        dose_details = dose_details.replace("\n", "<br/>").replace(" ", "&nbsp;")
-                    else:
-                        dose_details = "I don't have more information on this. Sorry."
-
-                    # FIXME: Workaround for dose multiarch bug - this dependency is perfectly fine,
-                    # but dose detects it as issue.
-                    if pkgname == "lib32nss-mdns":
-                        if dose_report.startswith("Unsat dependency amd64:libnss-mdns-i386"):
-                            continue
-
-                    info = dict()
-                    info['source'] = report.get('source', '')
-                    info['package'] = pkgname
-                    info['version'] = report.get('version', '')
-                    info['architecture'] = report.get('architecture', '')
-                    info['issue_summary'] = dose_report
-                    info['issue_details'] = dose_details
-                    info['issue_type'] = issue_type
-                    pkg_list.append(info)
-
-            render_template("debcheck/brokenpkg.html", "debcheck/brokenpkg_%s.html" % (arch),
-                page_name="debcheck", architecture=arch, broken_packages=pkg_list, time=time.strftime("%c"), suite=devel_suite)
+            issues = self._load_debcheck_issues(fname)
+
+            # the issue details are rendered by the browser from this file, when
+            # they are opened, which keeps the pages small
+            data = dict()
+            data['suite'] = devel_suite
+            data['architecture'] = arch
+            data['fields'] = DEBCHECK_DATA_FIELDS
+            data['packages'] = [[i[field] for field in DEBCHECK_DATA_FIELDS] for i in issues]
+            data['reasons'] = [i.pop('reasons') for i in issues]
+            data_name = "debcheck/brokenpkg_%s.json" % (arch)
+            write_output_file(data_name, json.dumps(data, separators=(',', ':'), default=str).encode('utf-8'), self._conf)
+
+            # the first page keeps the name of the single page we had before
+            pages = [issues[i:i + page_size] for i in range(0, len(issues), page_size)]
+            if not pages:
+                pages = [[]]
+            page_names = ["debcheck/brokenpkg_%s.html" % (arch)]
+            for i in range(2, len(pages) + 1):
+                page_names.append("debcheck/brokenpkg_%s_%i.html" % (arch, i))
+            page_urls = [os.path.basename(name) for name in page_names]
+
+            for i, (page, page_name) in enumerate(zip(pages, page_names)):
+                render_template("debcheck/brokenpkg.html", page_name,
+                    page_name="debcheck", architecture=arch, broken_packages=page, first_index=i * page_size,
+                    page_size=page_size, page_number=i + 1, page_urls=page_urls, page_urls_json=json.dumps(page_urls),
+                    total=len(issues), data_url=os.path.basename(data_name),
+                    time=time.strftime("%c"), suite=devel_suite)
+            self._remove_stale_pages(page_names[0], len(pages))
 
     def refresh_page(self, page_name):
         if page_name == "static":
@@ -157,16 +327,62 @@ class RapidumoPageRenderer:
         else:
             print("Unknown page name: %s" % (page_name))
 
+def show_build_rdepends(conf, binaries, suite=None, arch=None, recursive=False):
+    """
+     Print the sources which need to be rebuilt if the given binary
+     packages change, and the sources build-conflicting with them.
+    """
+    if not suite:
+        suite = conf.archive_config['devel_suite']
+    bi = PackageBuildInfoRetriever(conf)
+    graph = bi.get_build_dep_graph(suite, arch)
+    bindex = bi.get_binary_index(suite) if recursive else None
+
+    for source in sorted(graph.impact(binaries, bindex, recursive)):
+        print("%s %s" % (source, graph.get_version(source)))
+    for binary in binaries:
+        for source in graph.build_rconflicts(binary):
+            print("%s %s (build-conflicts with %s)" % (source, graph.get_version(source), binary))
+
 def main():
-    parser = OptionParser()
+    parser = OptionParser(usage="%prog [options] [index-server|update-archive-db|build-rdeps PACKAGE...]")
     parser.add_option("--refresh-page",
                   type="string", dest="refresh_page", default=None,
                   help="refresh a GUI page")
+    parser.add_option("--suite",
+                  type="string", dest="suite", default=None,
+                  help="suite to look at with build-rdeps (default: the development suite)")
+    parser.add_option("--arch",
+                  type="string", dest="arch", default=None,
+                  help="evaluate architecture restrictions for this architecture with build-rdeps")
+    parser.add_option("--recursive",
+                  action="store_true", dest="recursive", default=False,
+                  help="with build-rdeps, include the sources needing the rebuilt packages as well")
 
     (options, args) = parser.parse_args()
+    start_run("rapidumo", RapidumoConfig())
 
-    if options.refresh_page:
+    if args and args[0] == "index-server":
+        # keep the archive indices in memory, for all other rapidumo tools
+        from .indexserver import run_index_server
+        run_index_server(RapidumoConfig())
+    elif args and args[0] == "update-archive-db":
+        from .archivedb import ArchiveDB
+        conf = RapidumoConfig()
+        archive_db = ArchiveDB.from_config(conf)
+        if not archive_db:
+            print("No archive database configured (General: archive_db).")
+            sys.exit(1)
+        archive_db.refresh(conf)
+    elif args and args[0] == "build-rdeps":
+        if len(args) < 2:
+            print("Need the name of at least one binary package!")
+            sys.exit(1)
+        show_build_rdepends(RapidumoConfig(), args[1:], options.suite, options.arch, options.recursive)
+    elif options.refresh_page:
         helper = RapidumoPageRenderer()
         helper.refresh_page(options.refresh_page)
+        rendered, changed = get_changed_pages()
+        print("%i of %i pages changed." % (len(changed), rendered))
     else:
         print("Run with --help for a list of available command-line options!")
@@ -15,18 +15,132 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import yaml
 import os
+import time
+import threading
+
+CONFIG_FILE = '/srv/dak/tanglu-archive.yml'
+
+# seconds between two checks whether the configuration file has changed
+CONFIG_CHECK_INTERVAL = 2
+
+# keys which must be present in the configuration sections
+_REQUIRED_KEYS = {
+    'General': ('distro_name',),
+    'Archive': ('path', 'devel_suite'),
+}
+_REQUIRED_SUITE_KEYS = ('name', 'components', 'archs')
+_OPTIONAL_SECTIONS = ('Synchrotron', 'Janitor', 'Fedmsg')
+_INT_GENERAL_KEYS = ('index_cache_max_size', 'index_workers', 'archive_db_timeout',
+                     'dose_cache_max_age', 'dose_workers', 'dose_timeout',
+                     'debcheck_page_size', 'britney_output_page_lines', 'metrics_max_age')
+
+
+def validate_config(conf):
+    """
+     Check the structure of a loaded configuration, so mistakes show up
+     at load time and not in the middle of an archive run.
+    """
+    if not isinstance(conf, dict):
+        raise Exception("Invalid configuration: expected a mapping of sections")
+    for section, keys in _REQUIRED_KEYS.items():
+        data = conf.get(section)
+        if not isinstance(data, dict):
+            raise Exception("Invalid configuration: section '%s' is missing" % (section))
+        for key in keys:
+            if key not in data:
+                raise Exception("Invalid configuration: '%s' is missing in section '%s'" % (key, section))
+    for section in _OPTIONAL_SECTIONS:
+        if section in conf and not isinstance(conf[section], dict):
+            raise Exception("Invalid configuration: section '%s' is not a mapping" % (section))
+    for key in _INT_GENERAL_KEYS:
+        value = conf['General'].get(key)
+        if value is not None and not isinstance(value, int):
+            raise Exception("Invalid configuration: General/%s must be a number" % (key))
+
+    suites = conf.get('Suites')
+    if not isinstance(suites, list):
+        raise Exception("Invalid configuration: section 'Suites' must be a list")
+    names = set()
+    for suite in suites:
+        if not isinstance(suite, dict):
+            raise Exception("Invalid configuration: suite entries must be mappings")
+        for key in _REQUIRED_SUITE_KEYS:
+            if not isinstance(suite.get(key), str):
+                raise Exception("Invalid configuration: suite %s has no valid '%s' entry" % (suite.get('name'), key))
+        if suite['name'] in names:
+            raise Exception("Invalid configuration: suite %s is defined twice" % (suite['name']))
+        names.add(suite['name'])
+
+
+class _ConfigFile():
+    """
+     A parsed configuration file, shared by all RapidumoConfig instances
+     and reloaded when the file changes.
+    """
+
+    def __init__(self, fname):
+        self._fname = fname
+        self._lock = threading.Lock()
+        self._checked = time.monotonic()
+        self._load()
+
+    def _load(self):
+        import yaml
+        mtime = os.stat(self._fname).st_mtime_ns
+        with open(self._fname, 'r') as f:
+            conf = yaml.safe_load(f)
+        validate_config(conf)
+        self.conf = conf
+        self.suites = dict((s['name'], s) for s in conf['Suites'])
+        self._mtime = mtime
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self._checked < CONFIG_CHECK_INTERVAL:
+            return self
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.stat(self._fname).st_mtime_ns
+            except OSError:
+                return self
+            if mtime != self._mtime:
+                try:
+                    self._load()
+                except Exception as e:
+                    # keep running with what we have
+                    print("Unable to reload %s, keeping the old configuration: %s" % (self._fname, str(e)))
+                    self._mtime = mtime
+        return self
+
+
+_config_files = dict()
+_config_files_lock = threading.Lock()
+
+
+def _get_config_file(fname):
+    with _config_files_lock:
+        cfile = _config_files.get(fname)
+        if cfile is None:
+            cfile = _ConfigFile(fname)
+            _config_files[fname] = cfile
+        return cfile
 
 
 class RapidumoConfig():
-    def __init__(self):
-        self._conf = yaml.safe_load(open('/srv/dak/tanglu-archive.yml', 'r'))
+    def __init__(self, fname=CONFIG_FILE):
+        # all instances share the same parsed data, so creating one is cheap
+        self._file = _get_config_file(fname)
 
         self.debug_enabled = False
         if 'DEBUG' in os.environ:
             self.debug_enabled = True
 
+    @property
+    def _conf(self):
+        return self._file.refresh().conf
+
     @property
     def distro_name(self):
         return self._conf["General"]["distro_name"]
@@ -65,11 +179,11 @@ class RapidumoConfig():
             base_suite = apnd
         return base_suite
 
+    def get_suite(self, suite_name):
+        return self._file.refresh().suites.get(suite_name)
+
     def get_build_queue(self, suite_name):
-        sdict = None
-        for s in self.suites_config:
-            if s['name'] == suite_name:
-                sdict = s
+        sdict = self.get_suite(suite_name)
         if not sdict:
             return None
 
@@ -77,13 +191,9 @@ class RapidumoConfig():
         return bqueue
 
     def get_supported_archs(self, suite):
-        for s in self.suites_config:
-            if s['name'] == suite:
-                return s['archs']
-        return None
+        sdict = self.get_suite(suite)
+        return sdict['archs'] if sdict else None
 
     def get_supported_components(self, suite):
-        for s in self.suites_config:
-            if s['name'] == suite:
-                return s['components']
-        return None
+        sdict = self.get_suite(suite)
+        return sdict['components'] if sdict else None
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2016 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+from functools import lru_cache
+
+# enough to hold the versions of a few complete suites
+VERSION_KEY_CACHE_SIZE = 128 * 1024
+
+_fragment_re = re.compile(r"(\D*)(\d*)")
+
+
+def _char_order(c):
+    # same ordering as dpkg/apt: '~' sorts before everything, even the
+    # end of the string, letters sort before all other characters
+    if c == "~":
+        return -1
+    if c.isalpha() and c.isascii():
+        return ord(c)
+    return ord(c) + 256
+
+_char_orders = [_char_order(chr(i)) for i in range(128)]
+
+
+def _fragment_key(fragment):
+    key = list()
+    for alpha, num in _fragment_re.findall(fragment):
+        if not alpha and not num:
+            continue
+        for c in alpha:
+            o = ord(c)
+            key.append(_char_orders[o] if o < 128 else o + 256)
+        # the end of a non-digit part sorts like an empty string
+        key.append(0)
+        key.append(int(num) if num else 0)
+    # an empty fragment compares like a single zero, as in dpkg ("1.0" == "1.0-0"),
+    # while whatever follows a zero still counts ("0~rc1" < "0")
+    if not key:
+        key = [0, 0]
+    # marks the end of the fragment, so "1.0~rc1" sorts before "1.0"
+    key.append(0)
+    return tuple(key)
+
+
+@lru_cache(maxsize=VERSION_KEY_CACHE_SIZE)
+def version_key(version):
+    """
+     Turn a Debian version string into a hashable key, which orders the
+     same way as apt_pkg.version_compare() does.
+    """
+    epoch = 0
+    upstream = version
+    epoch_str, sep, rest = version.partition(":")
+    if sep and epoch_str.isdigit():
+        epoch = int(epoch_str)
+        upstream = rest
+
+    revision = ""
+    if "-" in upstream:
+        upstream, _, revision = upstream.rpartition("-")
+
+    return (epoch, _fragment_key(upstream), _fragment_key(revision))
+
+
+def compare_versions(a, b):
+    """
+     Compare two versions, returning a negative, zero or positive number
+     like apt_pkg.version_compare().
+    """
+    ka = version_key(a)
+    kb = version_key(b)
+    if ka < kb:
+        return -1
+    if ka > kb:
+        return 1
+    return 0
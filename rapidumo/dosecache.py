@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2016 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import hashlib
+import tempfile
+from .cache import CacheDir, file_digest, evict_files
+
+
+class DoseCache():
+    """
+     Content-addressed cache for dose3 reports.
+     Reports are keyed on the dose command line and the hashes of all
+     index files it reads, so a report is reused until one of its inputs
+     really changes.
+    """
+
+    def __init__(self, path, max_age=0, max_size=0):
+        self._path = path
+        self._max_age = max_age
+        self._max_size = max_size
+        if not os.path.exists(self._path):
+            os.makedirs(self._path)
+        # hashing big indices is expensive, so remember the digests of
+        # files we have already seen, keyed on their size and mtime
+        self._digest_cache = CacheDir(os.path.join(self._path, "digests"))
+        self._digests = self._digest_cache.load("digests") or dict()
+        self._digests_changed = False
+
+    def _index_digest(self, fname):
+        st = os.stat(fname)
+        known = self._digests.get(fname)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            return known[2]
+        digest = file_digest(fname)
+        self._digests[fname] = (st.st_size, st.st_mtime_ns, digest)
+        self._digests_changed = True
+        return digest
+
+    def make_key(self, cmd, index_files):
+        """
+         Build the cache key for a dose command. cmd contains the program and
+         all its flags, index_files the archive indices passed to it.
+        """
+        h = hashlib.sha256()
+        h.update("\0".join(cmd).encode('utf-8'))
+        for fname in index_files:
+            h.update(b"\0")
+            h.update(fname.encode('utf-8'))
+            h.update(self._index_digest(fname).encode('utf-8'))
+        if self._digests_changed:
+            self._digest_cache.store("digests", self._digests)
+            self._digests_changed = False
+        return h.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self._path, "%s.yml" % (key))
+
+    def get_path(self, key):
+        """
+         Return the path of a cached report, or None if we don't have it.
+        """
+        fname = self._entry_path(key)
+        if not os.path.isfile(fname):
+            return None
+        # mark the entry as recently used
+        os.utime(fname, None)
+        return fname
+
+    def load(self, key):
+        fname = self.get_path(key)
+        if not fname:
+            return None
+        with open(fname, 'rb') as f:
+            return f.read()
+
+    def new_entry(self):
+        """
+         Create a temporary file in the cache directory, which dose can write
+         its report to directly. Returns an (open file, filename) tuple, the
+         file is added to the cache with commit().
+        """
+        fd, tmp_fname = tempfile.mkstemp(dir=self._path, suffix=".tmp")
+        return os.fdopen(fd, 'w+b'), tmp_fname
+
+    def commit(self, key, tmp_fname):
+        os.replace(tmp_fname, self._entry_path(key))
+        self.evict()
+
+    def store(self, key, data):
+        f, tmp_fname = self.new_entry()
+        try:
+            with f:
+                f.write(data)
+            self.commit(key, tmp_fname)
+        except Exception:
+            os.unlink(tmp_fname)
+            raise
+
+    def evict(self):
+        evict_files(self._path, ".yml", self._max_size, self._max_age)
+
+    @staticmethod
+    def from_config(conf):
+        gcfg = conf.general_config
+        cache_dir = gcfg.get('cache_dir')
+        if not cache_dir:
+            return None
+        # reports which were not used for this long are outdated anyway
+        max_age = gcfg.get('dose_cache_max_age', 48) * 60 * 60
+        return DoseCache(os.path.join(cache_dir, "dose"), max_age)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2016 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# number of report entries parsed in one go
+DOSE_REPORT_BATCH = 64
+
+
+_yaml_loader = None
+
+
+def _get_yaml_loader():
+    # PyYAML is only imported once a report is actually read
+    global _yaml_loader
+    if not _yaml_loader:
+        try:
+            from yaml import CSafeLoader as SafeLoader
+        except ImportError:
+            from yaml import SafeLoader
+        _yaml_loader = SafeLoader
+    return _yaml_loader
+
+
+def _load_entries(lines, unquote):
+    import yaml
+    data = "".join(lines)
+    if unquote:
+        data = data.replace("%3a", ":")  # Support for wheezy version of dose
+    entries = yaml.load(data, Loader=_get_yaml_loader())
+    return entries if entries else list()
+
+
+def iter_dose_report(f, unquote=False, batch_size=DOSE_REPORT_BATCH):
+    """
+     Read a dose3 YAML report from the file object f and yield the entries
+     of its "report" list one by one, without loading the whole document.
+     If unquote is set, "%3a" is replaced by ":" like older dose versions need.
+    """
+    in_report = False
+    item_indent = -1
+    lines = list()
+    count = 0
+    for line in f:
+        if isinstance(line, bytes):
+            line = str(line, 'utf-8')
+        if not in_report:
+            if line.startswith("report:"):
+                inline = line[len("report:"):].strip()
+                if inline:
+                    # a report given in flow style, e.g. "report: []"
+                    yield from _load_entries([inline], unquote)
+                    return
+                in_report = True
+            continue
+
+        stripped = line.lstrip(" ")
+        if stripped and stripped[0] not in ("-", "\n") and len(stripped) == len(line):
+            # a top-level key, the report is over
+            break
+        if stripped.startswith("-"):
+            indent = len(line) - len(stripped)
+            if item_indent < 0:
+                item_indent = indent
+            if indent == item_indent:
+                # only split the data between two entries
+                if count >= batch_size:
+                    yield from _load_entries(lines, unquote)
+                    lines = list()
+                    count = 0
+                count += 1
+        lines.append(line)
+
+    if lines:
+        yield from _load_entries(lines, unquote)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2016 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import signal
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from .dosecache import DoseCache
+from .dosereport import iter_dose_report
+from .metrics import get_metrics
+
+# dose exits with 1 if it found broken packages, anything else is an error
+DOSE_OK_RETURNCODES = (0, 1)
+
+
+class DoseJob():
+    """
+     A single dose3 run: the dose command with all its flags, and the
+     archive indices it should check.
+    """
+
+    def __init__(self, name, dose_flags, index_files):
+        self.name = name
+        self.dose_flags = dose_flags
+        self.index_files = index_files
+
+    @property
+    def cmd(self):
+        return self.dose_flags + self.index_files
+
+
+class DoseResult():
+    """
+     The outcome of a DoseJob. report_file is a file object with the YAML
+     report, opened for binary reading, or None if dose did not finish.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.returncode = None
+        self.stderr = ""
+        self.report_file = None
+        self.duration = 0
+        self.timed_out = False
+        self.cached = False
+        self.cache_key = None
+        # the report's cache entry, until it is committed
+        self._tmp_fname = None
+
+    @property
+    def success(self):
+        return self.report_file is not None and self.returncode in DOSE_OK_RETURNCODES
+
+    def iter_report(self, unquote=False):
+        with self.report_file as f:
+            yield from iter_dose_report(f, unquote)
+
+    def read_report(self):
+        with self.report_file as f:
+            return f.read()
+
+    def close(self):
+        """
+         Close the report, and drop it if it was not added to the cache.
+        """
+        if self.report_file:
+            self.report_file.close()
+        if self._tmp_fname:
+            os.unlink(self._tmp_fname)
+            self._tmp_fname = None
+
+    def __str__(self):
+        if self.timed_out:
+            state = "timed out"
+        elif self.cached:
+            state = "cached"
+        else:
+            state = "exit code %s" % (self.returncode)
+        return "%s: %s (%.1fs)" % (self.job.name, state, self.duration)
+
+
+class DoseRunner():
+    """
+     Runs dose3 jobs on a bounded pool of workers, with an optional
+     timeout per job and reuse of cached reports.
+    """
+
+    def __init__(self, workers=0, timeout=0, cache=None):
+        self._workers = workers if workers else (os.cpu_count() or 1)
+        self._timeout = timeout if timeout else None
+        self._cache = cache
+
+    def _execute(self, job, result, report_file):
+        start = time.time()
+        # dose writes its report straight to the file, those can be huge
+        proc = subprocess.Popen(job.cmd, stdin=subprocess.DEVNULL, stdout=report_file, stderr=subprocess.PIPE,
+                                start_new_session=True)
+        try:
+            stderr = proc.communicate(timeout=self._timeout)[1]
+        except subprocess.TimeoutExpired:
+            # kill dose together with anything it has spawned
+            os.killpg(proc.pid, signal.SIGKILL)
+            stderr = proc.communicate()[1]
+            result.timed_out = True
+        result.returncode = proc.returncode
+        result.stderr = str(stderr, 'utf-8', 'replace')
+        result.duration = time.time() - start
+        get_metrics().record("subprocess.dose", result.duration)
+        return result
+
+    def _finish(self, result, report_file):
+        if result.timed_out:
+            report_file.close()
+            result.close()
+            return result
+        if result.returncode not in DOSE_OK_RETURNCODES:
+            # reports of failed runs are never cached
+            result.close()
+        report_file.seek(0)
+        result.report_file = report_file
+        return result
+
+    def _commit(self, result):
+        if result._tmp_fname:
+            self._cache.commit(result.cache_key, result._tmp_fname)
+            result._tmp_fname = None
+
+    def run(self, jobs, check=None):
+        """
+         Run all jobs, returning their DoseResults in the same order.
+         check is called with every result and may raise an exception to
+         reject it. Reports are only added to the cache once they passed the
+         check, and if any job fails, all reports are closed before the
+         error is raised.
+        """
+        results = list()
+        pending = list()
+        try:
+            with ThreadPoolExecutor(max_workers=self._workers) as executor:
+                for job in jobs:
+                    result = DoseResult(job)
+                    results.append(result)
+
+                    if self._cache:
+                        result.cache_key = self._cache.make_key(job.dose_flags, job.index_files)
+                        fname = self._cache.get_path(result.cache_key)
+                        if fname:
+                            result.cached = True
+                            get_metrics().count("dose.cached")
+                            result.returncode = 0
+                            result.report_file = open(fname, 'rb')
+                            continue
+                        report_file, result._tmp_fname = self._cache.new_entry()
+                    else:
+                        report_file = tempfile.TemporaryFile()
+
+                    future = executor.submit(self._execute, job, result, report_file)
+                    pending.append((future, report_file))
+
+                for future, report_file in pending:
+                    self._finish(future.result(), report_file)
+
+            # the cache is only touched from this thread
+            for result in results:
+                if check:
+                    check(result)
+                self._commit(result)
+        except BaseException:
+            # leaving the executor has waited for all jobs, so nothing
+            # writes to the reports anymore
+            for future, report_file in pending:
+                report_file.close()
+            for result in results:
+                result.close()
+            raise
+
+        return results
+
+    def run_one(self, job, check=None):
+        return self.run([job], check)[0]
+
+    @staticmethod
+    def from_config(conf):
+        gcfg = conf.general_config
+        return DoseRunner(gcfg.get('dose_workers', 0), gcfg.get('dose_timeout', 0),
+                          DoseCache.from_config(conf))
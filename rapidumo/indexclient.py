@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2016 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import socket
+from .config import RapidumoConfig
+
+
+class IndexServerError(Exception):
+    pass
+
+
+class IndexClient():
+    """
+     Talks to a running "rapidumo index-server" over its Unix socket.
+     Requests and replies are single lines of JSON.
+    """
+
+    def __init__(self, socket_path, timeout=60):
+        self._socket_path = socket_path
+        self._timeout = timeout
+        self._sock = None
+        self._stream = None
+        # set once the server could not be reached, so we don't retry for every query
+        self.unavailable = False
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self._timeout)
+        try:
+            sock.connect(self._socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+        self._stream = sock.makefile('rwb')
+
+    def close(self):
+        if self._sock:
+            self._stream.close()
+            self._sock.close()
+        self._sock = None
+        self._stream = None
+
+    def query(self, cmd, **kwargs):
+        """
+         Send a command to the server and return its result.
+         Raises OSError if the server can not be reached and
+         IndexServerError if it could not answer the query.
+        """
+        request = dict(kwargs)
+        request['cmd'] = cmd
+        data = json.dumps(request).encode('utf-8') + b"\n"
+        # the server may have closed an idle connection, so try twice
+        for attempt in range(2):
+            if not self._sock:
+                self._connect()
+            try:
+                self._stream.write(data)
+                self._stream.flush()
+                line = self._stream.readline()
+            except OSError:
+                self.close()
+                if attempt:
+                    raise
+                continue
+            if line:
+                break
+            self.close()
+            if attempt:
+                raise ConnectionResetError("Index server closed the connection")
+
+        reply = json.loads(str(line, 'utf-8'))
+        if not reply.get('ok'):
+            raise IndexServerError(reply.get('error', "Unknown error"))
+        return reply.get('result')
+
+    def try_query(self, cmd, **kwargs):
+        """
+         Like query(), but returns None instead of failing, so callers
+         can fall back to reading the indices themselves.
+        """
+        if self.unavailable:
+            return None
+        try:
+            return self.query(cmd, **kwargs)
+        except OSError:
+            self.unavailable = True
+            self.close()
+        except IndexServerError:
+            pass
+        return None
+
+    def ping(self):
+        return self.try_query("ping") is not None
+
+    def get_sources(self, path, suite, component):
+        return self.try_query("sources", path=path, suite=suite, component=component)
+
+    def get_records(self, path, suite, component, fields):
+        return self.try_query("records", path=path, suite=suite, component=component, fields=fields)
+
+
+_index_client = None
+_index_client_loaded = False
+
+
+def get_socket_path(conf):
+    return conf.general_config.get('index_server_socket')
+
+
+def get_index_client():
+    """
+     Return a client for the index server, or None if no server is running.
+    """
+    global _index_client, _index_client_loaded
+    if not _index_client_loaded:
+        _index_client_loaded = True
+        try:
+            socket_path = get_socket_path(RapidumoConfig())
+        except OSError:
+            # no rapidumo configuration on this machine
+            socket_path = None
+        if socket_path and os.path.exists(socket_path):
+            _index_client = IndexClient(socket_path)
+    if _index_client and _index_client.unavailable:
+        return None
+    return _index_client
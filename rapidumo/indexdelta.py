@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2016 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from .cache import cache_dir_from_config
+
+
+def _versions_of(pkgs):
+    # accept both package dicts and plain name->version maps
+    versions = dict()
+    for name, pkg in pkgs.items():
+        versions[name] = pkg if isinstance(pkg, str) else pkg.version
+    return versions
+
+
+class IndexDelta():
+    """
+     The changes between two snapshots of a suite/component.
+    """
+
+    def __init__(self, added, removed, changed):
+        # name -> version
+        self.added = added
+        # name -> version which was removed
+        self.removed = removed
+        # name -> (old version, new version)
+        self.changed = changed
+
+    @property
+    def names(self):
+        return set(self.added.keys()) | set(self.removed.keys()) | set(self.changed.keys())
+
+    def is_empty(self):
+        return not self.added and not self.removed and not self.changed
+
+    @staticmethod
+    def compute(old_versions, new_versions):
+        added = dict()
+        changed = dict()
+        for name, version in new_versions.items():
+            old = old_versions.get(name)
+            if old is None:
+                added[name] = version
+            elif old != version:
+                changed[name] = (old, version)
+        removed = dict()
+        for name, version in old_versions.items():
+            if name not in new_versions:
+                removed[name] = version
+        return IndexDelta(added, removed, changed)
+
+    def __str__(self):
+        return "Delta: %i added | %i removed | %i changed" % (len(self.added), len(self.removed), len(self.changed))
+
+
+class IndexSnapshots():
+    """
+     Stores name->version snapshots of suites, so later runs can work on
+     the packages which changed since then.
+    """
+
+    def __init__(self, cache):
+        self._cache = cache
+
+    def load(self, name):
+        return self._cache.load("snapshot:%s" % (name))
+
+    def save(self, name, pkgs):
+        self._cache.store("snapshot:%s" % (name), _versions_of(pkgs))
+
+    def delta(self, name, pkgs):
+        """
+         Compare a package dict with the stored snapshot. Returns None if
+         there is no snapshot to compare with.
+        """
+        old_versions = self.load(name)
+        if old_versions is None:
+            return None
+        return IndexDelta.compute(old_versions, _versions_of(pkgs))
+
+    def load_state(self, name):
+        return self._cache.load("state:%s" % (name))
+
+    def save_state(self, name, state):
+        self._cache.store("state:%s" % (name), state)
+
+    @staticmethod
+    def from_config(conf):
+        cache = cache_dir_from_config(conf, "snapshots")
+        if not cache:
+            return None
+        return IndexSnapshots(cache)
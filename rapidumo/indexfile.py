@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2016 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import stat
+from apt_pkg import TagFile
+from .config import RapidumoConfig
+
+# the index variants we know about, cheapest to read first
+INDEX_FORMATS = ("plain", "xz", "gz", "bz2")
+
+_FORMAT_EXTENSIONS = {
+    "plain": "",
+    "xz": ".xz",
+    "gz": ".gz",
+    "bz2": ".bz2",
+}
+
+_path_formats = None
+_release_cache = dict()
+
+
+def _get_path_formats():
+    """
+     Load the per-path format preferences from the configuration,
+     as (path-prefix, formats) pairs with the longest prefix first.
+    """
+    global _path_formats
+    if _path_formats is None:
+        _path_formats = list()
+        try:
+            conf = RapidumoConfig()
+        except OSError:
+            return _path_formats
+        for prefix, formats in conf.general_config.get('index_formats', {}).items():
+            for fmt in formats:
+                if fmt not in _FORMAT_EXTENSIONS:
+                    raise Exception("Unknown index format '%s' for %s" % (fmt, prefix))
+            _path_formats.append((os.path.realpath(prefix), tuple(formats)))
+        _path_formats.sort(key=lambda x: len(x[0]), reverse=True)
+    return _path_formats
+
+
+def set_index_formats(prefix, formats):
+    """
+     Select which index variants are used for files below prefix,
+     in order of preference.
+    """
+    for fmt in formats:
+        if fmt not in _FORMAT_EXTENSIONS:
+            raise Exception("Unknown index format: %s" % (fmt))
+    path_formats = _get_path_formats()
+    prefix = os.path.realpath(prefix)
+    path_formats[:] = [pf for pf in path_formats if pf[0] != prefix]
+    path_formats.append((prefix, tuple(formats)))
+    path_formats.sort(key=lambda x: len(x[0]), reverse=True)
+
+
+def index_base_path(path):
+    for ext in _FORMAT_EXTENSIONS.values():
+        if ext and path.endswith(ext):
+            return path[:-len(ext)]
+    return path
+
+
+def _formats_for(base_path, formats):
+    if formats:
+        return formats
+    real_path = os.path.realpath(base_path)
+    for prefix, fmts in _get_path_formats():
+        if real_path == prefix or real_path.startswith(prefix + "/"):
+            return fmts
+    return INDEX_FORMATS
+
+
+def _find_release(base_path):
+    """
+     Find the Release file of the dist an index belongs to.
+    """
+    dname = os.path.dirname(base_path)
+    for i in range(4):
+        if os.path.basename(dname) == "dists":
+            break
+        release = os.path.join(dname, "Release")
+        if os.path.isfile(release):
+            return release
+        dname = os.path.dirname(dname)
+    return None
+
+
+def _release_sizes(release):
+    """
+     Get the sizes a Release file records for the indices it lists,
+     keyed by their path relative to the Release file.
+    """
+    mtime = os.stat(release).st_mtime_ns
+    cached = _release_cache.get(release)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    sizes = dict()
+    with open(release, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            if not line.startswith(" "):
+                continue
+            parts = line.split()
+            if len(parts) == 3 and parts[1].isdigit():
+                sizes[parts[2]] = int(parts[1])
+    _release_cache[release] = (mtime, sizes)
+    return sizes
+
+
+def find_index(path, formats=None):
+    """
+     Find the cheapest current variant of an index file which is present on disk.
+     path may be given with or without a compression extension.
+     Returns a (path, format) tuple.
+    """
+    base_path = index_base_path(path)
+    candidates = list()
+    for fmt in _formats_for(base_path, formats):
+        fname = base_path + _FORMAT_EXTENSIONS[fmt]
+        try:
+            st = os.stat(fname)
+        except OSError:
+            continue
+        if stat.S_ISREG(st.st_mode):
+            candidates.append((fname, fmt, st))
+    if not candidates:
+        raise FileNotFoundError("No index file found for %s" % (base_path))
+
+    # a variant left behind by an earlier publication must not win over the
+    # current one: trust the Release file if there is one, else take the newest
+    release = _find_release(base_path)
+    if release:
+        sizes = _release_sizes(release)
+        release_dir = os.path.dirname(release)
+        for fname, fmt, st in candidates:
+            if sizes.get(os.path.relpath(fname, release_dir)) == st.st_size:
+                return fname, fmt
+    newest = max(st.st_mtime_ns for fname, fmt, st in candidates)
+    for fname, fmt, st in candidates:
+        if st.st_mtime_ns == newest:
+            return fname, fmt
+
+
+def find_index_path(path, formats=None):
+    fname, fmt = find_index(path, formats)
+    return fname
+
+
+def iter_index_sections(path, formats=None):
+    """
+     Yield the stanzas of an archive index as apt_pkg.TagSection objects,
+     reading the cheapest variant of the index which is available.
+    """
+    fname, fmt = find_index(path, formats)
+    with TagFile(fname) as tagf:
+        for section in tagf:
+            yield section
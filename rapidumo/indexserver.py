@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2016 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import json
+import time
+import signal
+import threading
+import socketserver
+from .pkginfo import read_sources_index, record_fields
+from .indexfile import find_index
+from .indexclient import IndexClient, get_socket_path
+
+# the package record fields we can answer from the PackageInfo objects we keep
+_RECORD_ATTRS = ('pkgname', 'version', 'archs', 'directory', 'dsc', 'maintainer',
+                 'comaintainers', 'homepage', 'extra_source_only')
+
+
+def _index_state(path):
+    """
+     Identify the current version of an index, so we notice when it changes.
+    """
+    fname, fmt = find_index(path)
+    st = os.stat(fname)
+    return (fname, st.st_size, st.st_mtime_ns)
+
+
+class LoadedSources():
+    def __init__(self, path, suite, component):
+        self.path = path
+        self.suite = suite
+        self.component = component
+        self.state = _index_state(path)
+        self.packages = read_sources_index(self.state[0], suite, component)
+        self.loaded = time.time()
+        self.hits = 0
+
+
+class IndexServer():
+    """
+     Keeps parsed Sources indices in memory and answers queries about them.
+     An index is parsed when it is first requested, and parsed again only
+     once its file has changed. Only indices below the archive roots of
+     the configuration are served.
+    """
+
+    def __init__(self, conf):
+        self._conf = conf
+        self._sources = dict()
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._queries = 0
+
+        roots = [conf.archive_config.get('path'), conf.archive_config.get('build_queues_path'),
+                 conf.general_config.get('packages_mirror'), conf.synchrotron_config.get('debian_mirror')]
+        self._roots = [os.path.join(os.path.realpath(root), "") for root in roots if root]
+
+    def _check_index_path(self, path):
+        real_path = os.path.realpath(path)
+        if os.path.basename(real_path) == "Sources":
+            for root in self._roots:
+                if real_path.startswith(root):
+                    return
+        raise Exception("Not a Sources index of the archive: %s" % (path))
+
+    def get_sources(self, path, suite, component):
+        self._check_index_path(path)
+        key = (path, suite, component)
+        with self._lock:
+            loaded = self._sources.get(key)
+            if loaded is None or loaded.state != _index_state(path):
+                print("Loading %s" % (path))
+                loaded = LoadedSources(path, suite, component)
+                self._sources[key] = loaded
+            loaded.hits += 1
+            return loaded
+
+    def _cmd_ping(self, request):
+        return {'uptime': time.time() - self._started, 'queries': self._queries,
+                'loaded': len(self._sources)}
+
+    def _cmd_sources(self, request):
+        loaded = self.get_sources(request['path'], request['suite'], request['component'])
+        return [pkg.to_list() for pkg in loaded.packages]
+
+    def _cmd_records(self, request):
+        fields = record_fields(request.get('fields'))
+        for field in fields:
+            if field not in _RECORD_ATTRS:
+                raise Exception("Field %s is not kept by the index server" % (field))
+        loaded = self.get_sources(request['path'], request['suite'], request['component'])
+        records = list()
+        for pkg in loaded.packages:
+            records.append([pkg.suite, pkg.component] + [getattr(pkg, field) for field in fields])
+        return {'fields': fields, 'records': records}
+
+    def handle_request(self, request):
+        self._queries += 1
+        func = getattr(self, "_cmd_%s" % (request.get('cmd', '').replace('-', '_')), None)
+        if not func:
+            raise Exception("Unknown command: %s" % (request.get('cmd')))
+        return func(request)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                result = self.server.index_server.handle_request(json.loads(str(line, 'utf-8')))
+                reply = {'ok': True, 'result': result}
+            except Exception as e:
+                reply = {'ok': False, 'error': str(e)}
+            self.wfile.write(json.dumps(reply).encode('utf-8') + b"\n")
+            self.wfile.flush()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def run_index_server(conf, socket_path=None):
+    if not socket_path:
+        socket_path = get_socket_path(conf)
+    if not socket_path:
+        print("No socket configured for the index server (General: index_server_socket).")
+        sys.exit(1)
+
+    # remove a socket left behind by an earlier instance, but never
+    # take it away from a server which is still running
+    if os.path.exists(socket_path):
+        client = IndexClient(socket_path, timeout=5)
+        if client.ping():
+            print("An index server is already running on %s." % (socket_path))
+            sys.exit(1)
+        client.close()
+        os.unlink(socket_path)
+    server = _UnixServer(socket_path, _RequestHandler)
+    server.index_server = IndexServer(conf)
+
+    def on_terminate(signum, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, on_terminate)
+
+    print("Index server listening on %s" % (socket_path))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
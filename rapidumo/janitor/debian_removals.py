@@ -18,12 +18,12 @@
 
 import os
 from apt_pkg import TagFile, TagSection
-import http.client
 import tempfile
 from .janitor_utils import PackageRemovalItem
 
 class DebianRemovals:
     def __init__(self):
+        import http.client
         c = http.client.HTTPSConnection("ftp-master.debian.org")
         c.request("GET", "/removals.822")
         response = c.getresponse()
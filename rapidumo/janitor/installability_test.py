@@ -17,9 +17,10 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from rapidumo.config import *
-import subprocess
-import yaml
 import re
+from ..indexfile import find_index_path
+from ..doserunner import DoseJob, DoseRunner
+from ..dosereport import iter_dose_report
 from .janitor_utils import PackageRemovalItem
 
 class JanitorDebcheck:
@@ -30,18 +31,19 @@ class JanitorDebcheck:
         self._archive_path = path
         self._devel_suite = aconf['devel_suite']
         self._distro = conf.distro_name.lower()
+        self._dose_runner = DoseRunner.from_config(conf)
 
     def _get_binary_indices_list(self, suite, comp, arch):
         archive_indices = []
-        archive_binary_index_path = self._archive_path + "/%s/dists/%s/%s/binary-%s/Packages.gz" % (self._distro, suite, comp, arch)
+        archive_binary_index_path = find_index_path(self._archive_path + "/%s/dists/%s/%s/binary-%s/Packages" % (self._distro, suite, comp, arch))
         archive_indices.append(archive_binary_index_path)
         if arch == "all":
             # if arch is all, we feed the solver with a binary architecture as example, to solve dependencies on arch-specific stuff
-            archive_binary_index_path_arch = self._archive_path + "/%s/dists/%s/%s/binary-amd64/Packages.gz" % (self._distro, suite, comp)
+            archive_binary_index_path_arch = find_index_path(self._archive_path + "/%s/dists/%s/%s/binary-amd64/Packages" % (self._distro, suite, comp))
             archive_indices.append(archive_binary_index_path_arch)
         else:
             # any architecture canb also depend on arch:all stuff, so we add it to the loop
-            archive_binary_index_path_all = self._archive_path + "/%s/dists/%s/%s/binary-all/Packages.gz" % (self._distro, suite, comp)
+            archive_binary_index_path_all = find_index_path(self._archive_path + "/%s/dists/%s/%s/binary-all/Packages" % (self._distro, suite, comp))
             archive_indices.append(archive_binary_index_path_all)
 
         if suite == "staging":
@@ -50,7 +52,7 @@ class JanitorDebcheck:
 
         return archive_indices
 
-    def _run_dose_debcheck(self, suite, arch):
+    def make_dose_job(self, suite, arch):
         # we always need the main component
         archive_indices = self._get_binary_indices_list(suite, "main", arch)
         # add contrib
@@ -60,45 +62,62 @@ class JanitorDebcheck:
         comp_indices = self._get_binary_indices_list(suite, "non-free", arch)
         archive_indices.extend(comp_indices)
 
-        dose_cmd = ["dose-debcheck", "--quiet", "-e", "-f", "--summary", "--latest=1", "--deb-native-arch=%s" % (arch)]
-        # add the archive index files
-        dose_cmd.extend(archive_indices)
+        dose_flags = ["dose-debcheck", "--quiet", "-e", "-f", "--summary", "--latest=1", "--deb-native-arch=%s" % (arch)]
+        return DoseJob("%s/%s" % (suite, arch), dose_flags, archive_indices)
 
-        proc = subprocess.Popen(dose_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = proc.communicate()
-        output = stdout
-        # we are (currently) not interested in dose errors
-        #if (proc.returncode != 0):
-        #    return False, stderr
-        return True, output
+    def run_debcheck(self, suite, archs):
+        """
+         Check all architectures at the same time, returning an arch->DoseResult dict.
+        """
+        # we are (currently) not interested in dose errors, only in timeouts
+        results = self._dose_runner.run([self.make_dose_job(suite, arch) for arch in archs])
+        return dict(zip(archs, results))
+
+    def open_debcheck_report(self, suite, architecture):
+        """
+         Get the dose-debcheck report as file object, opened for binary reading.
+        """
+        result = self._dose_runner.run_one(self.make_dose_job(suite, architecture))
+        if not result.report_file:
+            raise Exception("dose-debcheck did not finish: %s" % (result))
+        return result.report_file
 
     def get_debcheck_yaml(self, suite, architecture):
-        ret, output = self._run_dose_debcheck(suite, architecture)
-        return output
+        with self.open_debcheck_report(suite, architecture) as f:
+            return f.read()
 
-    def get_uninstallable_packages(self, suite, architecture):
-        # we return a package=>reason dictionary
+    def iter_debcheck_report(self, suite, architecture):
+        with self.open_debcheck_report(suite, architecture) as f:
+            yield from iter_dose_report(f)
+
+    def _read_uninstallable_packages(self, reports):
         res = {}
-        info = self.get_debcheck_yaml(suite, architecture)
-        doc = yaml.safe_load(info)
-        if doc['report'] is not None:
-            for p in doc['report']:
-                pkg = p['source']
-                if pkg.startswith('src%3a'):
-                    pkg = pkg.replace('src%3a', "", 1)
-                if not "(" in pkg:
-                    continue
-                parts = pkg.split ('(')
-                pkg = parts[0].strip()
-                version = parts[1].replace("=", "", 1).strip()
-                version = re.sub('\)$', '', version)
-                res["%s/%s" % (pkg, version)] = p['reasons']
+        for p in reports:
+            pkg = p['source']
+            if pkg.startswith('src%3a'):
+                pkg = pkg.replace('src%3a', "", 1)
+            if not "(" in pkg:
+                continue
+            parts = pkg.split ('(')
+            pkg = parts[0].strip()
+            version = parts[1].replace("=", "", 1).strip()
+            version = re.sub('\)$', '', version)
+            res["%s/%s" % (pkg, version)] = p['reasons']
         return res
 
+    def get_uninstallable_packages(self, suite, architecture):
+        # we return a package=>reason dictionary
+        return self._read_uninstallable_packages(self.iter_debcheck_report(suite, architecture))
+
     def get_uninstallable_removals(self, suite, archs):
         cruft_dict = {}
+        results = self.run_debcheck(suite, archs)
         for arch in archs:
-            uninst_pkgs = self.get_uninstallable_packages(suite, arch)
+            result = results[arch]
+            if not result.report_file:
+                print("Skipping uninstallable packages on %s, dose-debcheck did not finish: %s" % (arch, result))
+                continue
+            uninst_pkgs = self._read_uninstallable_packages(result.iter_report())
             for pkg_id in uninst_pkgs.keys():
                 parts = pkg_id.split("/")
                 pkg = parts[0]
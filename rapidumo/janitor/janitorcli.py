@@ -24,11 +24,13 @@ import re
 from optparse import OptionParser
 
 from ..pkginfo import *
+from ..debversion import version_key
 from ..utils import *
 from ..config import *
 from .janitor_utils import *
 from .debian_removals import DebianRemovals
 from .installability_test import JanitorDebcheck
+from ..metrics import span, start_run
 
 
 class Janitor:
@@ -74,7 +76,7 @@ class Janitor:
                         version_norebuild = pkg_item.version
                     else:
                         version_norebuild = m.group(1)
-                    if apt_pkg.version_compare(version_norebuild, rmitem.version) > 0:
+                    if version_key(version_norebuild) > version_key(rmitem.version):
                         # the version in Tanglu is newer, we don't want to delete the package
                         continue
                     tglpkgrm = PackageRemovalItem(self._current_suite, pkg_item.pkgname, pkg_item.version, rmitem.reason)
@@ -118,9 +120,10 @@ class Janitor:
         else:
             for rmitem in removals_list:
                 cmd = ["dak", "rm", "-s", rmitem.suite, "-m", rmitem.reason, "-C", "ftpmaster@ftp-master.tanglu.org", rmitem.pkgname]
-                p = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                p.communicate(input=b'y\n')
-                p.wait()
+                with span("subprocess.dak-rm"):
+                    p = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                    p.communicate(input=b'y\n')
+                    p.wait()
                 if p.returncode is not 0:
                     stdout, stderr = p.communicate()
                     raise Exception("Error while running dak!\n----\n%s\n%s %s" % (cmd, stdout, stderr))
@@ -154,6 +157,7 @@ def main():
                   help="don't show output (except for errors)")
 
     (options, args) = parser.parse_args()
+    start_run("janitor", RapidumoConfig())
 
     if options.cruft_remove:
         janitor = Janitor(options.suite)
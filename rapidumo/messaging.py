@@ -15,25 +15,253 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-try:
-    import fedmsg
-except ImportError:
-    fedmsg = None
-
+import time
+import queue
+import atexit
+import threading
+import importlib.util
 from .config import RapidumoConfig
+from .metrics import count
+
+# fedmsg is imported and set up on the first message we send, so programs
+# which never emit anything don't pay for connecting the message bus
+_fedmsg = None
+_fedmsg_loaded = False
 
-if fedmsg:
-    config = RapidumoConfig()
-    fmcfg = config.fedmsg_config
 
+def get_fedmsg():
+    """
+     Return the initialized fedmsg module, or None if fedmsg is not available.
+     fedmsg keeps its connection per thread, so this must be called from
+     the thread which publishes the messages.
+    """
+    global _fedmsg, _fedmsg_loaded
+    if _fedmsg_loaded:
+        return _fedmsg
+    _fedmsg_loaded = True
+    try:
+        import fedmsg
+    except ImportError:
+        return None
+
+    fmcfg = RapidumoConfig().fedmsg_config
     fedmsg.init(
         topic_prefix=fmcfg.get("prefix", "org.tanglu"),
         environment=fmcfg.get("environment", "dev"),
         sign_messages=fmcfg.get("sign", False),
         endpoints=fmcfg.get("endpoints", {}),
     )
+    _fedmsg = fedmsg
+    return _fedmsg
 
-def emit_raw(component, modname, topic, message):
-    modname = "%s.%s" % (component, modname)
+
+def publish_fedmsg(modname, topic, message):
+    fedmsg = get_fedmsg()
     if fedmsg:
-        return fedmsg.publish(topic=topic, modname=modname, msg=message)
+        fedmsg.publish(topic=topic, modname=modname, msg=message)
+
+
+class MessageEmitter():
+    """
+     Publishes messages from a background thread, so a slow message bus
+     never stalls the caller.
+     Messages wait in a bounded queue. The sender takes the messages queued
+     within batch_delay seconds from it at once, and publishes exact
+     duplicates among them only once. Every other message is still
+     published on its own, so consumers see the usual message format.
+     If the queue is full, emit() waits up to block_timeout seconds for
+     space and drops the message otherwise.
+    """
+
+    def __init__(self, publish=None, queue_size=1000, batch_size=50, batch_delay=0.2, block_timeout=0):
+        self._publish = publish if publish else publish_fedmsg
+        self._queue = queue.Queue(queue_size)
+        self._batch_size = max(batch_size, 1)
+        self._batch_delay = batch_delay
+        self._block_timeout = block_timeout
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._thread = None
+        self._closed = False
+        self._stopping = False
+
+        # statistics
+        self.queued = 0
+        self.published = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.failed = 0
+
+    def _start(self):
+        with self._cond:
+            if self._thread:
+                return
+            self._thread = threading.Thread(target=self._run, name="rapidumo-messaging")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def emit(self, modname, topic, message):
+        """
+         Queue a message for publishing. Returns False if it was dropped.
+        """
+        with self._cond:
+            if self._closed:
+                self.dropped += 1
+                count("messaging.dropped")
+                return False
+            self._pending += 1
+        if not self._thread:
+            self._start()
+
+        item = (modname, topic, message)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            queued = False
+            if self._block_timeout:
+                with self._cond:
+                    self.blocked += 1
+                count("messaging.blocked")
+                try:
+                    self._queue.put(item, timeout=self._block_timeout)
+                    queued = True
+                except queue.Full:
+                    pass
+            if not queued:
+                with self._cond:
+                    self._pending -= 1
+                    self.dropped += 1
+                    self._cond.notify_all()
+                count("messaging.dropped")
+                return False
+
+        with self._cond:
+            self.queued += 1
+        return True
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is None:
+            self._stopping = True
+            return list()
+        batch = [item]
+        deadline = time.monotonic() + self._batch_delay
+        while len(batch) < self._batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                self._stopping = True
+                break
+            batch.append(item)
+        return batch
+
+    def _send_batch(self, batch):
+        sent = list()
+        coalesced = 0
+        published = 0
+        failed = 0
+        for item in batch:
+            if item in sent:
+                coalesced += 1
+                continue
+            sent.append(item)
+            modname, topic, message = item
+            try:
+                self._publish(modname, topic, message)
+                published += 1
+            except Exception as e:
+                print("Unable to publish message on %s.%s: %s" % (modname, topic, str(e)))
+                failed += 1
+
+        with self._cond:
+            self.coalesced += coalesced
+            self.published += published
+            self.failed += failed
+        count("messaging.published", published)
+        if failed:
+            count("messaging.failed", failed)
+
+    def _run(self):
+        while not self._stopping:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._send_batch(batch)
+            finally:
+                with self._cond:
+                    self._pending -= len(batch)
+                    self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """
+         Wait until all queued messages were published.
+         Returns False if that did not happen within timeout seconds.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout=None):
+        """
+         Publish the remaining messages and stop the sender thread.
+        """
+        with self._cond:
+            if self._closed:
+                return True
+            self._closed = True
+        done = self.flush(timeout)
+        if self._thread and done:
+            self._queue.put(None)
+            self._thread.join(timeout)
+        if not done:
+            print("Dropping %i unpublished messages." % (self._pending))
+            count("messaging.dropped", self._pending)
+        with self._cond:
+            if self.dropped or self.failed:
+                print("Warning: %i messages were dropped and %i failed to publish." % (self.dropped, self.failed))
+        return done
+
+    def get_stats(self):
+        with self._cond:
+            return {'queued': self.queued, 'published': self.published, 'coalesced': self.coalesced,
+                    'dropped': self.dropped, 'blocked': self.blocked, 'failed': self.failed,
+                    'pending': self._pending}
+
+
+_emitter = None
+_emitter_loaded = False
+_emitter_lock = threading.Lock()
+
+
+def get_emitter():
+    """
+     Return the emitter for this process, or None if fedmsg is not installed.
+     Messages still queued are published when the process exits.
+    """
+    global _emitter, _emitter_loaded
+    with _emitter_lock:
+        if _emitter_loaded:
+            return _emitter
+        _emitter_loaded = True
+        if not importlib.util.find_spec("fedmsg"):
+            return None
+
+        fmcfg = RapidumoConfig().fedmsg_config
+        _emitter = MessageEmitter(queue_size=fmcfg.get("queue_size", 1000),
+                                  batch_size=fmcfg.get("batch_size", 50),
+                                  batch_delay=fmcfg.get("batch_delay", 0.2),
+                                  block_timeout=fmcfg.get("block_timeout", 0))
+        atexit.register(_emitter.close, fmcfg.get("flush_timeout", 30))
+        return _emitter
+
+
+def emit_raw(component, modname, topic, message):
+    emitter = get_emitter()
+    if emitter:
+        emitter.emit("%s.%s" % (component, modname), topic, message)
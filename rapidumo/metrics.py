@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2016 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import json
+import atexit
+import tempfile
+import threading
+from contextlib import contextmanager
+from .cache import evict_files
+from .debversion import version_key
+
+
+class Metrics():
+    """
+     Timed spans and counters collected during one run of a rapidumo tool.
+     Spans with the same name are summed up, so they may be entered from
+     hot code and from several threads.
+    """
+
+    def __init__(self, job="rapidumo"):
+        self.job = job
+        self._lock = threading.Lock()
+        # span name -> [count, total seconds, longest seconds]
+        self._spans = dict()
+        self._counters = dict()
+        self._started = time.time()
+        self._start_clock = time.perf_counter()
+
+    def record(self, name, seconds):
+        with self._lock:
+            span = self._spans.get(name)
+            if span is None:
+                self._spans[name] = [1, seconds, seconds]
+                return
+            span[0] += 1
+            span[1] += seconds
+            if seconds > span[2]:
+                span[2] = seconds
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def to_dict(self):
+        with self._lock:
+            counters = dict(self._counters)
+            spans = dict()
+            for name, (count, total, longest) in self._spans.items():
+                spans[name] = {'count': count, 'seconds': total, 'max_seconds': longest}
+
+        # the version keys are memoized, so their cache statistics tell
+        # how many version comparisons we did without counting each one
+        info = version_key.cache_info()
+        counters['version_key.calls'] = info.hits + info.misses
+        counters['version_key.parsed'] = info.misses
+
+        return {'job': self.job,
+                'started': self._started,
+                'duration': time.perf_counter() - self._start_clock,
+                'spans': spans,
+                'counters': counters}
+
+    def to_prometheus(self, data=None):
+        """
+         Return the metrics in the Prometheus text format.
+        """
+        if not data:
+            data = self.to_dict()
+        job = data['job']
+        lines = list()
+
+        def add(metric, mtype, help_text, samples):
+            lines.append("# HELP %s %s" % (metric, help_text))
+            lines.append("# TYPE %s %s" % (metric, mtype))
+            for labels, value in samples:
+                labels = ",".join('%s="%s"' % (k, v.replace('"', '\\"')) for k, v in [('job', job)] + labels)
+                lines.append("%s{%s} %s" % (metric, labels, repr(float(value))))
+
+        add("rapidumo_run_start_time_seconds", "gauge", "Start time of the last run.",
+            [([], data['started'])])
+        add("rapidumo_run_duration_seconds", "gauge", "Duration of the last run.",
+            [([], data['duration'])])
+        spans = sorted(data['spans'].items())
+        add("rapidumo_span_seconds", "gauge", "Time spent in a phase during the last run.",
+            [([('span', name)], s['seconds']) for name, s in spans])
+        add("rapidumo_span_max_seconds", "gauge", "Longest single execution of a phase during the last run.",
+            [([('span', name)], s['max_seconds']) for name, s in spans])
+        add("rapidumo_span_count", "gauge", "Executions of a phase during the last run.",
+            [([('span', name)], s['count']) for name, s in spans])
+        add("rapidumo_counter", "gauge", "Counters of the last run.",
+            [([('name', name)], value) for name, value in sorted(data['counters'].items())])
+        return "\n".join(lines) + "\n"
+
+    def write(self, metrics_dir, textfile_dir=None, max_age=0):
+        """
+         Write the metrics of this run to a new JSON file in metrics_dir, and
+         replace the job's Prometheus textfile in textfile_dir (or metrics_dir).
+        """
+        data = self.to_dict()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(data['started']))
+        _write_file(metrics_dir, "%s-%s-%i.json" % (self.job, stamp, os.getpid()),
+                    json.dumps(data, indent=2, sort_keys=True))
+        _write_file(textfile_dir if textfile_dir else metrics_dir,
+                    "rapidumo_%s.prom" % (self.job), self.to_prometheus(data))
+        evict_files(metrics_dir, ".json", max_age=max_age)
+
+
+def _write_file(directory, name, content):
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    # write to a temporary file first, readers must never see partial files
+    fd, tmp_fname = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.chmod(tmp_fname, 0o644)
+        os.replace(tmp_fname, os.path.join(directory, name))
+    except Exception:
+        os.unlink(tmp_fname)
+        raise
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    return _metrics
+
+
+def span(name):
+    """
+     Time a block of code, e.g. "with span('index-load'):"
+    """
+    return _metrics.span(name)
+
+
+def count(name, value=1):
+    _metrics.count(name, value)
+
+
+def _write_run_metrics(conf):
+    gcfg = conf.general_config
+    try:
+        _metrics.write(gcfg['metrics_dir'], gcfg.get('metrics_textfile_dir'),
+                       gcfg.get('metrics_max_age', 30) * 24 * 60 * 60)
+    except OSError as e:
+        print("Unable to write metrics: %s" % (str(e)))
+
+
+def start_run(job, conf):
+    """
+     Name the job we collect metrics for, and write them when the
+     process exits, if a metrics directory is configured.
+    """
+    _metrics.job = job
+    if conf.general_config.get('metrics_dir'):
+        atexit.register(_write_run_metrics, conf)
@@ -15,12 +15,19 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import sys
-import glob
-import gzip
-import re
-import subprocess
-from apt_pkg import TagFile, version_compare
+from collections import namedtuple
+from functools import lru_cache
+from .debversion import version_key
+from .cache import IndexCache, get_index_cache, cache_dir_from_config
+from .poolindex import PoolIndex
+from .binaryindex import BinaryIndex, read_binary_index
+from .indexclient import get_index_client
+from .builddeps import BuildDepGraph, parse_build_relations
+from .indexfile import iter_index_sections, find_index_path
+from .doserunner import DoseJob, DoseRunner
+from .metrics import span
 
 
 def package_list_to_dict(pkg_list):
@@ -28,9 +35,7 @@ def package_list_to_dict(pkg_list):
     for pkg in pkg_list:
         # replace it only if the version of the new item is higher (required to handle epoch bumps and new uploads)
         if pkg.pkgname in pkg_dict:
-            regVersion = pkg_dict[pkg.pkgname].version
-            compare = version_compare(regVersion, pkg.version)
-            if compare >= 0:
+            if version_key(pkg_dict[pkg.pkgname].version) >= version_key(pkg.version):
                 continue
         pkg_dict[pkg.pkgname] = pkg
     return pkg_dict
@@ -51,20 +56,114 @@ def find_dsc(value):
     return None
 
 
+# fields which can be requested from iter_packages(), mapped to the
+# Sources tag they are read from
+SOURCE_RECORD_FIELDS = {
+    'pkgname': 'Package',
+    'version': 'Version',
+    'archs': 'Architecture',
+    'directory': 'Directory',
+    'dsc': 'Files',
+    'maintainer': 'Maintainer',
+    'comaintainers': 'Uploaders',
+    'homepage': 'Homepage',
+    'build_depends': 'Build-Depends',
+    'build_depends_indep': 'Build-Depends-Indep',
+    'build_conflicts': 'Build-Conflicts',
+    'build_conflicts_indep': 'Build-Conflicts-Indep',
+    'extra_source_only': 'Extra-Source-Only',
+}
+
+
+@lru_cache(maxsize=None)
+def _record_type(fields):
+    return namedtuple('PackageRecord', ('suite', 'component') + fields)
+
+
+def record_fields(fields=None):
+    """
+     Normalize the list of fields requested for package records.
+    """
+    if fields is None:
+        fields = tuple(SOURCE_RECORD_FIELDS.keys())
+    fields = ('pkgname', 'version') + tuple(f for f in fields if f not in ('pkgname', 'version'))
+    for field in fields:
+        if field not in SOURCE_RECORD_FIELDS:
+            raise Exception("Unknown package field: %s" % (field))
+    return fields
+
+
+def iter_source_records(source_path, suite, component, fields=None, skip_extra_source=False):
+    """
+     Yield a lightweight record for every stanza in a Sources file, only
+     holding the requested fields (name and version are always present).
+    """
+    fields = record_fields(fields)
+    tags = [(field, SOURCE_RECORD_FIELDS[field]) for field in fields]
+    record_type = _record_type(fields)
+
+    for section in iter_index_sections(source_path):
+        if skip_extra_source and section.get('Extra-Source-Only', 'no') == 'yes':
+            continue
+        values = [suite, component]
+        for field, tag in tags:
+            if field == 'dsc':
+                values.append(find_dsc(section[tag]))
+            elif field == 'extra_source_only':
+                values.append(section.get(tag, 'no') == 'yes')
+            elif field == 'homepage':
+                values.append(section.get(tag, None))
+            else:
+                values.append(section.get(tag, ''))
+        yield record_type._make(values)
+
+
+def dedup_records(records):
+    """
+     Reduce a stream of package records to the highest version of
+     every package.
+    """
+    best = dict()
+    for rec in records:
+        known = best.get(rec.pkgname)
+        if known is not None and version_key(known.version) >= version_key(rec.version):
+            continue
+        best[rec.pkgname] = rec
+    return iter(best.values())
+
+
+def intern_archs(archs):
+    if isinstance(archs, str):
+        return sys.intern(archs)
+    return tuple(sys.intern(arch) for arch in archs)
+
+
 class PackageInfo():
+    # we keep tens of thousands of these around for every suite we load,
+    # so use slots and share the strings which repeat all the time
+    __slots__ = ('pkgname', 'version', 'suite', 'component', 'archs',
+                 'binaries', 'installed_archs', 'directory', 'dsc',
+                 'build_depends', 'build_depends_indep', 'build_conflicts',
+                 'build_conflicts_indep', 'maintainer',
+                 'comaintainers', 'homepage', 'extra_source_only',
+                 'queue_name')
+
     def __init__(self, pkgname, pkgversion, suite, component, archs, directory, dsc):
         self.pkgname = pkgname
         self.version = pkgversion
-        self.suite = suite
-        self.component = component
-        self.archs = archs
-        self.binaries = []
-        self.installed_archs = []
+        self.suite = sys.intern(suite)
+        self.component = sys.intern(component)
+        self.archs = intern_archs(archs)
+        # (name, arch, filename) tuples of the binaries built from this source
+        self.binaries = ()
+        self.installed_archs = ()
         self.directory = directory
         self.dsc = dsc
 
         self.build_depends = ""
+        self.build_depends_indep = ""
         self.build_conflicts = ""
+        self.build_conflicts_indep = ""
 
         self.maintainer = ""
         self.comaintainers = ""
@@ -77,9 +176,59 @@ class PackageInfo():
     def getVersionNoEpoch(self):
         return noEpoch(self.version)
 
+    def to_list(self):
+        """
+         Serialize this package as a list of values, in __slots__ order.
+        """
+        return [getattr(self, attr) for attr in self.__slots__]
+
+    @staticmethod
+    def from_list(values):
+        data = dict(zip(PackageInfo.__slots__, values))
+        pkg = PackageInfo(data['pkgname'], data['version'], data['suite'], data['component'],
+                          data['archs'], data['directory'], data['dsc'])
+        for attr in PackageInfo.__slots__[5:]:
+            setattr(pkg, attr, data[attr])
+        # JSON has no tuples
+        pkg.binaries = tuple(tuple(b) for b in pkg.binaries)
+        pkg.installed_archs = intern_archs(pkg.installed_archs)
+        if pkg.maintainer:
+            pkg.maintainer = sys.intern(pkg.maintainer)
+        return pkg
+
     def __str__(self):
         return "Package: name: %s | version: %s | suite: %s | comp.: %s" % (self.pkgname, self.version, self.suite, self.component)
 
+def _get_archive_db():
+    # the archive database module builds on this one, so import it late
+    from .archivedb import get_archive_db
+    return get_archive_db()
+
+
+def read_sources_index(source_path, suite, component):
+    """
+     Read a Sources file into a list of PackageInfo objects.
+    """
+    packageList = []
+    for section in iter_index_sections(source_path):
+        archs = section['Architecture']
+        pkgversion = section['Version']
+        pkgname = section['Package']
+        directory = section['Directory']
+        dsc = find_dsc(section['Files'])
+        pkg = PackageInfo(pkgname, pkgversion, suite, component, archs, directory, dsc)
+        pkg.maintainer = sys.intern(section['Maintainer'])
+        pkg.comaintainers = section.get('Uploaders', '')
+        pkg.homepage = section.get('Homepage', None)
+
+        if section.get('Extra-Source-Only', 'no') == 'yes':
+            pkg.extra_source_only = True
+
+        packageList.append(pkg)
+
+    return packageList
+
+
 class SourcePackageInfoRetriever():
     """
      Retrieve information about source packages available
@@ -92,39 +241,109 @@ class SourcePackageInfoRetriever():
         self._suiteName = suite
         self.extra_suite = ""
         self.useMOMCache = momCache
+        self.index_cache = get_index_cache()
+        # ask a running index server first, if there is one
+        self.index_client = get_index_client()
+        # if set, Sources data is read from (and kept up to date in) the archive database
+        self.archive_db = _get_archive_db()
 
-    def _get_packages_for(self, suite, component):
+    def _get_index_path(self, suite, component):
         if self.useMOMCache:
-            source_path = self._archive_path + "/dists/%s-%s/%s/source/Sources" % (self._distroName, suite, component)
-        else:
-            aroot = self._archive_path
-            if suite.startswith("buildq"):
-                aroot = self._bqueue_path
-            source_path = aroot + "/%s/dists/%s/%s/source/Sources.gz" % (self._distroName, suite, component)
-        f = gzip.open(source_path, 'rb')
-        tagf = TagFile(f)
-        packageList = []
-        for section in tagf:
-            archs = section['Architecture']
-            pkgversion = section['Version']
-            pkgname = section['Package']
-            directory = section['Directory']
-            dsc = find_dsc(section['Files'])
-            pkg = PackageInfo(pkgname, pkgversion, suite, component, archs, directory, dsc)
-            pkg.maintainer = section['Maintainer']
-            pkg.comaintainers = section.get('Uploaders', '')
-            pkg.homepage = section.get('Homepage', None)
-
-            if section.get('Extra-Source-Only', 'no') == 'yes':
-                pkg.extra_source_only = True
+            return self._archive_path + "/dists/%s-%s/%s/source/Sources" % (self._distroName, suite, component)
+        aroot = self._archive_path
+        if suite.startswith("buildq"):
+            aroot = self._bqueue_path
+        return aroot + "/%s/dists/%s/%s/source/Sources" % (self._distroName, suite, component)
 
-            packageList.append(pkg)
+    def _get_packages_for(self, suite, component):
+        packageList = None
+        if self.index_client:
+            with span("index-load.server"):
+                pkg_lists = self.index_client.get_sources(self._get_index_path(suite, component), suite, component)
+                if pkg_lists is not None:
+                    packageList = [PackageInfo.from_list(values) for values in pkg_lists]
+        if packageList is None and self.archive_db:
+            with span("index-load.archive-db"):
+                packageList = self.archive_db.get_sources(self._get_index_path(suite, component), suite, component)
+        if packageList is None:
+            packageList = self._read_packages_for(suite, component)
 
         if self.extra_suite:
             packageList.extend(self._get_packages_for(self.extra_suite, component))
 
         return packageList
 
+    def _read_packages_for(self, suite, component):
+        source_path = find_index_path(self._get_index_path(suite, component))
+
+        parse_func = lambda path: self._read_sources_index(path, suite, component)
+        with span("index-load.sources"):
+            if self.index_cache:
+                packageList = self.index_cache.get("sources:%s:%s" % (suite, component), source_path, parse_func)
+            else:
+                packageList = parse_func(source_path)
+
+        return packageList
+
+    def _read_sources_index(self, source_path, suite, component):
+        return read_sources_index(source_path, suite, component)
+
+    def iter_packages(self, suite, component, fields=None, dedup=True):
+        """
+         Iterate over the packages of a suite without building PackageInfo
+         objects. Only the requested fields are extracted.
+         If dedup is set, only the highest version of each package is returned,
+         which requires keeping one small record per package until the index
+         has been read completely. Without it, records are streamed directly.
+        """
+        suites = [suite]
+        if self.extra_suite and self.extra_suite != suite:
+            suites.append(self.extra_suite)
+
+        def records():
+            for s in suites:
+                index_path = self._get_index_path(s, component)
+                rows = None
+                if self.index_client:
+                    rows = self.index_client.get_records(index_path, s, component, record_fields(fields))
+                if rows is not None:
+                    record_type = _record_type(tuple(rows['fields']))
+                    for values in rows['records']:
+                        yield record_type._make(values)
+                elif self.archive_db:
+                    db_fields = record_fields(fields)
+                    record_type = _record_type(db_fields)
+                    for values in self.archive_db.iter_records(index_path, s, component, db_fields):
+                        yield record_type._make(values)
+                else:
+                    yield from iter_source_records(index_path, s, component, fields)
+
+        if dedup:
+            return dedup_records(records())
+        return records()
+
+    def get_package(self, component, name):
+        """
+         Look up the highest version of a single package.
+        """
+        if self.archive_db:
+            self.archive_db.refresh_sources(self._get_index_path(self._suiteName, component),
+                                            self._suiteName, component)
+            pkgs = self.archive_db.find_source(name, self._suiteName, component)
+            if self.extra_suite:
+                self.archive_db.refresh_sources(self._get_index_path(self.extra_suite, component),
+                                                self.extra_suite, component)
+                pkgs += self.archive_db.find_source(name, self.extra_suite, component)
+            return package_list_to_dict(pkgs).get(name)
+        return self.get_packages_dict(component).get(name)
+
+    def snapshot_name(self, component):
+        """
+         Identifier of a component of this suite, for use with IndexSnapshots.
+        """
+        return "%s:%s:%s" % (os.path.realpath(os.path.join(self._archive_path, self._distroName)),
+                             self._suiteName, component)
+
     def get_packages_dict(self, component):
         packageList = self._get_packages_for(self._suiteName, component)
 
@@ -143,17 +362,66 @@ class PackageBuildInfoRetriever():
         self._conf = conf
         self._archive_path = "%s/%s" % (self._conf.archive_config['path'], self._conf.distro_name)
         self._bqueue_path = self._conf.archive_config['build_queues_path']
+        self.index_cache = IndexCache.from_config(self._conf)
+        self.pool_cache = cache_dir_from_config(self._conf, "pool")
+        # number of processes used to read the binary indices
+        self.workers = self._conf.general_config.get('index_workers', 0)
+        if not self.workers:
+            self.workers = os.cpu_count() or 1
+
+    def _get_index_path(self, suite, component, is_build_queue=False):
+        if is_build_queue:
+            return self._bqueue_path + "/dists/%s/%s/source/Sources" % (suite, component)
+        return self._archive_path + "/dists/%s/%s/source/Sources" % (suite, component)
 
     def _get_package_list(self, suite, component, is_build_queue=False):
-        source_path = None
-        if is_build_queue:
-            source_path = self._bqueue_path + "/dists/%s/%s/source/Sources.gz" % (suite, component)
+        source_path = find_index_path(self._get_index_path(suite, component, is_build_queue))
+
+        parse_func = lambda path: self._read_sources_index(path, suite, component)
+        if self.index_cache:
+            packageList = self.index_cache.get("buildinfo:%s:%s" % (suite, component), source_path, parse_func)
         else:
-            source_path = self._archive_path + "/dists/%s/%s/source/Sources.gz" % (suite, component)
-        f = gzip.open(source_path, 'rb')
-        tagf = TagFile(f)
+            packageList = parse_func(source_path)
+
+        bqueue = self._conf.get_build_queue(suite)
+        if bqueue:
+            packageList.extend(self._get_package_list(bqueue, component, is_build_queue=True))
+
+        return packageList
+
+    def _get_build_relations(self, suite, component, arch=None, is_build_queue=False):
+        source_path = find_index_path(self._get_index_path(suite, component, is_build_queue))
+
+        # parsing the relations is expensive, so we cache the result per index
+        parse_func = lambda path: parse_build_relations(self._read_sources_index(path, suite, component), arch)
+        with span("index-load.builddeps"):
+            if self.index_cache:
+                relations = self.index_cache.get("builddeps:%s:%s:%s" % (suite, component, arch), source_path, parse_func)
+            else:
+                relations = parse_func(source_path)
+
+        bqueue = self._conf.get_build_queue(suite)
+        if bqueue:
+            relations = relations + self._get_build_relations(bqueue, component, arch, is_build_queue=True)
+
+        return relations
+
+    def get_build_dep_graph(self, suite, arch=None):
+        """
+         Build the BuildDepGraph of a suite, including the relations only
+         needed to build arch:all packages. If arch is set, architecture
+         restrictions are evaluated for it, otherwise they are ignored and
+         the relations of all architectures are kept.
+        """
+        base_suite = self._conf.get_base_suite(suite)
+        graph = BuildDepGraph()
+        for component in self._conf.get_supported_components(base_suite).split(" "):
+            graph.add_relations(self._get_build_relations(suite, component, arch))
+        return graph
+
+    def _read_sources_index(self, source_path, suite, component):
         packageList = []
-        for section in tagf:
+        for section in iter_index_sections(source_path):
             # don't even try to build source-only packages
             if section.get('Extra-Source-Only', 'no') == 'yes':
                 continue
@@ -171,76 +439,110 @@ class PackageBuildInfoRetriever():
 
             # values needed for build-dependency solving
             pkg.build_depends = section.get('Build-Depends', '')
+            pkg.build_depends_indep = section.get('Build-Depends-Indep', '')
             pkg.build_conflicts = section.get('Build-Conflicts', '')
+            pkg.build_conflicts_indep = section.get('Build-Conflicts-Indep', '')
 
-            pkg.maintainer = section['Maintainer']
+            pkg.maintainer = sys.intern(section['Maintainer'])
             pkg.comaintainers = section.get('Uploaders', '')
 
             packageList += [pkg]
 
-        bqueue = self._conf.get_build_queue(suite)
-        if bqueue:
-            packageList.extend(self._get_package_list(bqueue, component, is_build_queue=True))
-
         return packageList
 
-    def _add_binaries_to_dict(self, pkg_dict, suite, component, arch, udeb=False):
+    def iter_packages(self, suite, component, fields=None, dedup=True):
+        """
+         Iterate over the buildable packages of a suite and its build queue,
+         extracting only the requested fields.
+        """
+        def records():
+            yield from iter_source_records(self._get_index_path(suite, component), suite, component,
+                                           fields, skip_extra_source=True)
+            bqueue = self._conf.get_build_queue(suite)
+            if bqueue:
+                yield from iter_source_records(self._get_index_path(bqueue, component, True), bqueue, component,
+                                               fields, skip_extra_source=True)
+
+        if dedup:
+            return dedup_records(records())
+        return records()
+
+    def _get_binary_index_path(self, suite, component, arch, udeb=False):
         aroot = self._archive_path
         if suite.startswith("buildq"):
             aroot = self._bqueue_path
         if udeb:
-            source_path = aroot + "/dists/%s/%s/debian-installer/binary-%s/Packages.gz" % (suite, component, arch)
-        else:
-            source_path = aroot + "/dists/%s/%s/binary-%s/Packages.gz" % (suite, component, arch)
-        f = gzip.open(source_path, 'rb')
-        tagf = TagFile(f)
-        for section in tagf:
-            # make sure we have the right arch (closes bug in installed-detection)
-            if section['Architecture'] != arch:
-                continue
+            return aroot + "/dists/%s/%s/debian-installer/binary-%s/Packages" % (suite, component, arch)
+        return aroot + "/dists/%s/%s/binary-%s/Packages" % (suite, component, arch)
 
-            pkgversion = section['Version']
-            pkgname = section['Package']
-            pkgsource = section.get('Source', pkgname)
-            # if source has different version, we cheat and set the binary pkg version
-            # to the source package version
-            if "(" in pkgsource:
-                m = re.search(r"^(.*)\((.*)\)$", pkgsource)
-                pkgsource = m.group(1).strip()
-                pkgversion = m.group(2).strip()
-
-            pkg = pkg_dict.get(pkgsource, None)
-
-            if pkg is not None and pkg.version == pkgversion:
-                if arch not in pkg.installed_archs:
-                    pkg.installed_archs += [arch]
-                pkg.binaries += [(pkgname, arch, section['Filename'])]
-                pkg_dict[pkgsource] = pkg
+    def get_binary_index_list(self, suite):
+        """
+         Return (path, arch) pairs of all binary indices of suite (and its base suite).
+        """
+        base_suite = self._conf.get_base_suite(suite)
+        suites = [suite, base_suite] if suite != base_suite else [suite]
+        components = self._conf.get_supported_components(base_suite).split(" ")
+        archs = self._conf.get_supported_archs(base_suite).split(" ") + ["all"]
 
-        return pkg_dict
+        indices = list()
+        for suite in suites:
+            for component in components:
+                for arch in archs:
+                    indices.append((self._get_binary_index_path(suite, component, arch), arch))
+                    indices.append((self._get_binary_index_path(suite, component, arch, udeb=True), arch))
+        return indices
+
+    def get_binary_index(self, suite):
+        """
+         Build the BinaryIndex of all binary packages in suite (and its base suite).
+        """
+        indices = self.get_binary_index_list(suite)
+        index_paths = [path for path, arch in indices]
+        index_archs = [arch for path, arch in indices]
+
+        # the indices are read in parallel, but merged in the order we
+        # requested them, so the result does not depend on scheduling
+        bindex = BinaryIndex()
+        with span("index-load.binaries"):
+            if self.workers > 1:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                # never fork, the caller may have threads holding locks
+                spawn = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(max_workers=self.workers, mp_context=spawn) as executor:
+                    results = executor.map(read_binary_index, index_paths, index_archs)
+                    for arch, binaries in zip(index_archs, results):
+                        bindex.add_records(arch, binaries)
+            else:
+                results = map(read_binary_index, index_paths, index_archs)
+                for arch, binaries in zip(index_archs, results):
+                    bindex.add_records(arch, binaries)
+
+        return bindex
 
     def get_packages_dict(self, suite):
         base_suite = self._conf.get_base_suite(suite)
-        suites = [suite, base_suite] if suite != base_suite else [suite]
-        components = self._conf.get_supported_components(base_suite).split(" ")
         archs = self._conf.get_supported_archs(base_suite).split(" ") + ["all"]
+        components = self._conf.get_supported_components(base_suite).split(" ")
 
         pkg_list = []
         for component in components:
             pkg_list += self._get_package_list(suite, component)
         pkg_dict = package_list_to_dict(pkg_list)
 
-        for suite in suites:
-            for component in components:
-                for arch in archs:
-                    pkg_dict = self._add_binaries_to_dict(pkg_dict, suite, component, arch)
-                    pkg_dict = self._add_binaries_to_dict(pkg_dict, suite, component, arch, udeb=True)
+        bindex = self.get_binary_index(suite)
+        for pkg in pkg_dict.values():
+            binaries = bindex.binaries_of(pkg.pkgname, pkg.version)
+            if binaries:
+                pkg.binaries = tuple(binaries)
+                pkg.installed_archs = tuple(dict.fromkeys(arch for name, arch, fname in binaries))
 
-        for name, pkg in pkg_dict.items():
+        pool = PoolIndex(self._archive_path, self.pool_cache)
+        pool.update()
+        for name, pkg in list(pkg_dict.items()):
             for arch in archs:
                 if (arch not in pkg.installed_archs and
-                        glob.glob(self._archive_path + "/%s/*_%s_%s.deb" %
-                                  (pkg.directory, noEpoch(pkg.version), arch))):
+                        pool.has_debs(pkg.directory, noEpoch(pkg.version), arch)):
                     # There are *.deb files in the pool, but no entries in Packages.gz
                     # We don't want spurious build jobs if this is a temporary error,
                     # but without info on the binary packages we can't use them either,
@@ -257,6 +559,7 @@ class BuildCheck:
         self._conf = conf
         self._archive_path = "%s/%s" % (self._conf.archive_config['path'], self._conf.distro_name)
         self._bqueue_path = self._conf.archive_config['build_queues_path']
+        self._dose_runner = DoseRunner.from_config(self._conf)
 
     def _get_pkg_indices_list(self, suite_name, comp, arch, add_sources=False, is_build_queue=False):
         build_queue = self._conf.get_build_queue(suite_name)
@@ -280,32 +583,50 @@ class BuildCheck:
         pkg_indices = list()
         for suite in suites:
             for comp in comps:
-                pkg_indices.append(suite['apath'] + "/dists/%s/%s/binary-%s/Packages.gz" % (suite['name'], comp, arch))
+                pkg_indices.append(find_index_path(suite['apath'] + "/dists/%s/%s/binary-%s/Packages" % (suite['name'], comp, arch)))
                 if add_sources:
-                    pkg_indices.append(suite['apath'] + "/dists/%s/%s/source/Sources.gz" % (suite['name'], comp))
+                    pkg_indices.append(find_index_path(suite['apath'] + "/dists/%s/%s/source/Sources" % (suite['name'], comp)))
 
         return pkg_indices
 
-    def get_package_states_yaml_sources(self, suite, comp, arch, source_gz_path=None):
+    def make_dose_job(self, suite, comp, arch, source_gz_path=None):
+        """
+         Create the dose-builddebcheck job checking the buildability of the
+         packages in suite/comp, or in the given Sources index.
+        """
         add_sources = not source_gz_path
-        dose_cmd = ["dose-builddebcheck", "--quiet", "--latest=1", "-e", "-f", "--summary", "--deb-native-arch=%s" % (arch)]
-        dose_cmd += self._get_pkg_indices_list(suite, comp, arch, add_sources)
+        dose_flags = ["dose-builddebcheck", "--quiet", "--latest=1", "-e", "-f", "--summary", "--deb-native-arch=%s" % (arch)]
+        index_files = self._get_pkg_indices_list(suite, comp, arch, add_sources)
         if source_gz_path:
-            dose_cmd += [source_gz_path]
+            index_files += [find_index_path(source_gz_path)]
+        return DoseJob("%s/%s/%s" % (suite, comp, arch), dose_flags, index_files)
 
-        proc = subprocess.Popen(dose_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = proc.communicate()
-        if stderr:
-            stderr = str(stderr, 'utf-8')
+    def check_dose_result(self, result):
+        if result.timed_out:
+            raise Exception("dose-builddebcheck did not finish in time: %s" % (result))
+        if result.stderr:
             # FIXME: hack to ignore this particular error...
-            if not "Unable to get real version for mplayer2" in stderr:
-                raise Exception(stderr)
+            if not "Unable to get real version for mplayer2" in result.stderr:
+                raise Exception(result.stderr)
+
+    def run_dose_jobs(self, jobs):
+        """
+         Run several dose-builddebcheck jobs concurrently.
+        """
+        return self._dose_runner.run(jobs, self.check_dose_result)
+
+    def iter_package_states(self, suite, comp, arch, source_gz_path=None):
+        """
+         Yield the dose-builddebcheck report entries one by one.
+        """
+        result, = self.run_dose_jobs([self.make_dose_job(suite, comp, arch, source_gz_path)])
+        yield from result.iter_report(unquote=True)
 
-        # make this work on Python2 as well
-        if sys.version_info >= (3,):
-            stdout = str(stdout, 'utf-8')
+    def get_package_states_yaml_sources(self, suite, comp, arch, source_gz_path=None):
+        result, = self.run_dose_jobs([self.make_dose_job(suite, comp, arch, source_gz_path)])
+        ydata = str(result.read_report(), 'utf-8')
 
-        ydata = stdout.replace("%3a", ":")  # Support for wheezy version of dose-builddebcheck
+        ydata = ydata.replace("%3a", ":")  # Support for wheezy version of dose-builddebcheck
         return ydata
 
     def get_package_states_yaml(self, suite, comp, arch):
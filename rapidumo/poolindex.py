@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2016 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+
+class PoolIndex():
+    """
+     Index of the binary packages present in an archive pool.
+     The pool is walked once, and the per-directory results are persisted
+     together with the directory mtimes, so later runs only need to list
+     directories which changed.
+    """
+
+    def __init__(self, archive_path, cache=None):
+        self._archive_path = archive_path
+        self._cache = cache
+        self._cache_key = "pool:%s" % (os.path.realpath(archive_path))
+        # relative directory -> (mtime, subdirectories, (version, arch) set)
+        self._dirs = dict()
+        self._debs = set()
+
+    def _scan_dir(self, path):
+        subdirs = list()
+        debs = set()
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.name.endswith(".deb"):
+                    # <package>_<version without epoch>_<arch>.deb
+                    parts = entry.name[:-4].split("_")
+                    if len(parts) == 3:
+                        debs.add((parts[1], parts[2]))
+        return tuple(subdirs), frozenset(debs)
+
+    def update(self):
+        old_dirs = None
+        if self._cache:
+            old_dirs = self._cache.load(self._cache_key)
+        if not old_dirs:
+            old_dirs = dict()
+
+        dirs = dict()
+        todo = ["pool"]
+        while todo:
+            reldir = todo.pop()
+            path = os.path.join(self._archive_path, reldir)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            entry = old_dirs.get(reldir)
+            if entry is None or entry[0] != mtime:
+                subdirs, debs = self._scan_dir(path)
+                entry = (mtime, subdirs, debs)
+            dirs[reldir] = entry
+            todo.extend(reldir + "/" + subdir for subdir in entry[1])
+
+        self._dirs = dirs
+        self._debs = set()
+        for reldir, (mtime, subdirs, debs) in dirs.items():
+            for version, arch in debs:
+                self._debs.add((reldir, version, arch))
+
+        if self._cache:
+            self._cache.store(self._cache_key, dirs)
+
+    def has_debs(self, directory, version, arch):
+        """
+         Check if there are .deb files for the given version and architecture
+         in a pool directory. The version must not contain an epoch.
+        """
+        return (directory.strip("/"), version, arch) in self._debs
@@ -36,37 +36,33 @@ class CruftReport:
         self._private_pkgs = read_commented_listfile(os.path.join(synchints_root, "private-packages.txt"))
         self._private_pkgs = set(self._private_pkgs)
 
+        # we only need to know which package names exist in Debian
         debian_suite = self._conf.syncsource_config['suite']
         pkginfo_src = SourcePackageInfoRetriever(self._debian_mirror, "", debian_suite)
-        self._pkgs_src = dict()
+        self._debian_pkgs = set()
         for component in ['main', 'contrib', 'non-free']:
-            self._pkgs_src.update(pkginfo_src.get_packages_dict(component))
+            for pkg in pkginfo_src.iter_packages(debian_suite, component, fields=('pkgname',), dedup=False):
+                self._debian_pkgs.add(pkg.pkgname)
 
     def _get_packages_not_in_debian(self, target_suite):
         pkginfo_dest = SourcePackageInfoRetriever(self._pkgs_mirror, self._conf.distro_name, target_suite)
         pkgs_dest = dict()
         for component in self._conf.get_supported_components(target_suite).split(' '):
-            pkgs_dest.update(pkginfo_dest.get_packages_dict(component))
+            for pkg in pkginfo_dest.iter_packages(target_suite, component, fields=('pkgname', 'version')):
+                pkgs_dest[pkg.pkgname] = pkg
 
-        debian_pkg_list = list(self._pkgs_src.keys())
         removed_pkgs = list()
-
-        for pkgname in pkgs_dest.keys():
-            if pkgname in debian_pkg_list:
+        for pkgname, pkg in pkgs_dest.items():
+            if pkgname in self._debian_pkgs:
                 continue
-            else:
-                removed_pkgs.append(pkgs_dest[pkgname])
-
-        # we don't want Tanglu-only packages on the removal list,
-        # so we exclude them here.
-        for pkg in removed_pkgs[:]:
+            # we don't want Tanglu-only packages on the removal list,
+            # so we exclude them here.
             if "-0tanglu" in pkg.version:
-                removed_pkgs.remove(pkg)
                 continue
             # ignore Tanglu-specific packages
-            if pkg.pkgname in self._private_pkgs:
-                removed_pkgs.remove(pkg)
+            if pkgname in self._private_pkgs:
                 continue
+            removed_pkgs.append(pkg)
 
         return removed_pkgs
 
@@ -20,9 +20,8 @@ import os
 import sys
 import subprocess
 import select
-import gzip
-import lzma
 from .. import RapidumoConfig
+from ..metrics import span
 
 
 class DebianMirror:
@@ -31,6 +30,25 @@ class DebianMirror:
         self._conf = RapidumoConfig()
         self._mirrordir = self._conf.synchrotron_config.get('debian_mirror')
 
+    def _remove_unlisted_indices(self, dists, sections):
+        """
+         Delete Sources.gz files which are not part of the mirrored archive.
+         We used to create them for experimental, and a host preferring gz
+         indices would otherwise feed the outdated files to dose.
+        """
+        for dist in dists.split(','):
+            release_fname = os.path.join(self._mirrordir, 'dists', dist, 'Release')
+            if not os.path.isfile(release_fname):
+                continue
+            with open(release_fname, 'r', encoding='utf-8', errors='replace') as f:
+                listed = set(line.split()[-1] for line in f if line.startswith(' '))
+            for section in sections.split(','):
+                index_name = "%s/source/Sources.gz" % (section)
+                fname = os.path.join(self._mirrordir, 'dists', dist, index_name)
+                if index_name not in listed and os.path.isfile(fname):
+                    print("Removing %s, it is not part of the Debian archive." % (fname))
+                    os.unlink(fname)
+
     def update(self):
         targetdir = self._mirrordir
         if not targetdir:
@@ -51,36 +69,26 @@ class DebianMirror:
             cmd.append('--verbose')
         cmd.append(targetdir)
 
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        while True:
-            reads = [proc.stdout.fileno(), proc.stderr.fileno()]
-            ret = select.select(reads, [], [])
+        with span("subprocess.debmirror"):
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            while True:
+                reads = [proc.stdout.fileno(), proc.stderr.fileno()]
+                ret = select.select(reads, [], [])
 
-            for fd in ret[0]:
-                if fd == proc.stdout.fileno():
-                    read = proc.stdout.readline()
-                    if debug:
-                        sys.stdout.write(str(read, 'utf-8'))
-                if fd == proc.stderr.fileno():
-                    read = proc.stderr.readline()
-                    if debug:
-                        sys.stderr.write(str(read, 'utf-8'))
+                for fd in ret[0]:
+                    if fd == proc.stdout.fileno():
+                        read = proc.stdout.readline()
+                        if debug:
+                            sys.stdout.write(str(read, 'utf-8'))
+                    if fd == proc.stderr.fileno():
+                        read = proc.stderr.readline()
+                        if debug:
+                            sys.stderr.write(str(read, 'utf-8'))
 
-            if proc.poll() != None:
-                break
+                if proc.poll() != None:
+                    break
 
         if proc.returncode == 0:
-            # workaround to have GZip files for Debian experimental (until dose3 support XZ natively)
-            for section in sections.split(','):
-                basepath = os.path.join(targetdir, 'dists', 'experimental', section, 'source')
-                sfile = os.path.join(basepath, 'Sources.xz')
-                tfile = os.path.join(basepath, 'Sources.gz')
-                if not os.path.isfile(sfile):
-                    continue
-                sf = lzma.open(sfile, 'r')
-                tf = gzip.open(tfile, 'wb')
-                tf.write(sf.read())
-                tf.close()
-                sf.close()
+            self._remove_unlisted_indices(dists, sections)
             return True
         return False
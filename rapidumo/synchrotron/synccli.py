@@ -22,14 +22,17 @@ import apt_pkg
 import subprocess
 import re
 import time
-import yaml
 import glob
+import hashlib
 from optparse import OptionParser
 
 from .. import RapidumoConfig
-from ..pkginfo import *
+from ..pkginfo import SourcePackageInfoRetriever, BuildCheck
+from ..debversion import version_key
+from ..indexdelta import IndexSnapshots
 from ..utils import render_template, read_commented_listfile
-from ..messaging import *
+from ..messaging import emit_raw
+from ..metrics import span, start_run
 from .debian_mirror import DebianMirror
 from .cruft_report import CruftReport
 
@@ -62,6 +65,7 @@ class SyncPackage:
 
         pkginfo_dest = SourcePackageInfoRetriever(self._pkgs_mirror, self._dest_distro, target_suite)
         self._pkgs_dest = pkginfo_dest.get_packages_dict(component)
+        self._dest_snapshot_name = pkginfo_dest.snapshot_name(component)
         self._pkg_blacklist = read_commented_listfile("%s/sync-blacklist.txt" % self._synchints_root)
         self._pkg_autosync_overrides = dict()
         self._pkg_sets_dir = None
@@ -79,17 +83,27 @@ class SyncPackage:
         for suite in suites:
             pkginfo_src = SourcePackageInfoRetriever(self._debian_mirror, "", source_suite)
             self._pkgs_src[suite] = pkginfo_src.get_packages_dict(component)
+            if suite == source_suite:
+                self._src_snapshot_name = pkginfo_src.snapshot_name(component)
+            self.bcheck_data[suite] = None
 
-            # don't load debcheck data if we are not supposed to use it later
-            if not self._debcheck_before_sync:
-                self.bcheck_data[suite] = None
-                continue
+        # don't load debcheck data if we are not supposed to use it later
+        if not self._debcheck_before_sync:
+            return
 
-            # determine if the to-be-synced packages are buildable
-            bcheck = BuildCheck(self._conf)
-            ydata = bcheck.get_package_states_yaml_sources(target_suite, component, "amd64",
-                            self._debian_mirror + "/dists/%s/%s/source/Sources.gz" % (suite, component))
-            self.bcheck_data[suite] = yaml.safe_load(ydata)['report']
+        # determine if the to-be-synced packages are buildable, checking
+        # all Debian suites at the same time
+        bcheck = BuildCheck(self._conf)
+        jobs = list()
+        for suite in suites:
+            jobs.append(bcheck.make_dose_job(target_suite, component, "amd64",
+                            self._debian_mirror + "/dists/%s/%s/source/Sources" % (suite, component)))
+        results = bcheck.run_dose_jobs(jobs)
+        for suite, result in zip(suites, results):
+            states = dict()
+            for report in result.iter_report(unquote=True):
+                states[(report['package'], str(report['version']))] = report
+            self.bcheck_data[suite] = states
 
     def _load_pkgset_file(self, fname):
         hints = dict()
@@ -124,10 +138,7 @@ class SyncPackage:
         if not self.bcheck_data[self._sourceSuite]:
             return None
 
-        for nbpkg in self.bcheck_data[self._sourceSuite]:
-            if (nbpkg['package'] == ("src:" + pkg.pkgname) and (nbpkg['version'] == pkg.version)):
-                return nbpkg
-        return None
+        return self.bcheck_data[self._sourceSuite].get(("src:" + pkg.pkgname, pkg.version))
 
     def _import_debian_package(self, pkg):
         print("Attempt to import package: %s (%s)" % (pkg, pkg.getVersionNoEpoch()))
@@ -142,8 +153,9 @@ class SyncPackage:
         pkg_path = self._debian_mirror + "/pool/%s/%s/%s_%s.dsc" % (pkg.component, pkg_dir, pkg.pkgname, pkg.getVersionNoEpoch())
 
         cmd = ["dak", "import", "-s", "-a", self._target_suite, self._component, pkg_path]
-        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        p.wait()
+        with span("subprocess.dak-import"):
+            p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            p.wait()
         if p.returncode is not 0:
             stdout, stderr = p.communicate()
             print("ERR: %s\n%s %s" % (cmd, stdout, stderr))
@@ -177,8 +189,7 @@ class SyncPackage:
         if dest_pkg == None:
             return True, None
 
-        compare = version_compare(dest_pkg.version, src_pkg.version)
-        if compare >= 0:
+        if version_key(dest_pkg.version) >= version_key(src_pkg.version):
             if not quiet:
                 print("Package %s has a newer/equal version in the target distro. (Version in target: %s, source is %s)" % (dest_pkg.pkgname, dest_pkg.version, src_pkg.version))
             return False, None
@@ -310,34 +321,75 @@ class SyncPackage:
 
         return self.sync_packages(hints.keys())
 
-    def sync_all_packages(self):
+    def _sync_policy_digest(self):
+        # anything besides the archive contents which influences sync decisions
+        policy = (sorted(self._pkg_blacklist), sorted(self._pkg_autosync_overrides.items()),
+                  self._sync_enabled, sorted(self._supported_archs), self._debcheck_before_sync)
+        return hashlib.sha1(repr(policy).encode('utf-8')).hexdigest()
+
+    def _get_incremental_names(self, snapshots, state_name):
+        """
+         Return the names of all packages which need to be looked at again,
+         or None if we need to evaluate everything.
+        """
+        state = snapshots.load_state(state_name)
+        if not state or state['policy'] != self._sync_policy_digest():
+            return None
+        src_delta = snapshots.delta(state_name + ":" + self._src_snapshot_name, self._pkgs_src[self._sourceSuite])
+        dest_delta = snapshots.delta(state_name + ":" + self._dest_snapshot_name, self._pkgs_dest)
+        if src_delta is None or dest_delta is None:
+            return None
+        print("INFO: Source %s, target %s" % (src_delta, dest_delta))
+
+        # packages which could not be synced last time are always checked again
+        return src_delta.names | dest_delta.names | set(state['recheck'])
+
+    def sync_all_packages(self, incremental=False):
         sync_fails = list()
+        recheck = set()
 
         if not self._sync_enabled:
             print("INFO: Package syncs are currently disabled. Will only sync packages with permanent freeze exceptions.")
 
+        snapshots = IndexSnapshots.from_config(self._conf)
+        state_name = "synchrotron:%s:%s:%s" % (self._sourceSuite, self._target_suite, self._component)
+        eval_names = None
+        if incremental:
+            if snapshots:
+                eval_names = self._get_incremental_names(snapshots, state_name)
+            if eval_names is None:
+                print("INFO: No usable snapshot of the last run found, checking all packages.")
+
         def perform_sync(src_pkg):
             if not src_pkg.pkgname in self._pkgs_dest:
                 ret, sinfo = self._can_sync_package(src_pkg, None, True)
                 if not ret and sinfo != None:
                     sync_fails.append(sinfo)
+                    recheck.add(src_pkg.pkgname)
                 if ret:
                     if self.dry_run:
                         print("Sync: %s" % (src_pkg))
                     elif self._sync_allowed(src_pkg):
                         self._import_debian_package(src_pkg)
+                    else:
+                        recheck.add(src_pkg.pkgname)
                 return
             ret, sinfo = self._can_sync_package(src_pkg, self._pkgs_dest[src_pkg.pkgname], True)
             if not ret and sinfo != None:
                     sync_fails.append(sinfo)
+                    recheck.add(src_pkg.pkgname)
             if ret:
                 if self.dry_run:
                     print("Sync: %s" % (src_pkg))
                 elif self._sync_allowed(src_pkg):
                     self._import_debian_package(src_pkg)
+                else:
+                    recheck.add(src_pkg.pkgname)
 
         # sync all packages where no rule exists
         for src_pkg in self._pkgs_src[self._sourceSuite].values():
+            if eval_names is not None and src_pkg.pkgname not in eval_names:
+                continue
             perform_sync(src_pkg)
 
         # now sync the stuff which has explicit auto-sync hints
@@ -353,11 +405,14 @@ class SyncPackage:
                 page_name="synchrotron", sync_failures=sync_fails, time=time.strftime("%c"), component=self._component,
                 import_freeze=not self._sync_enabled)
 
+        # remember what we have seen, so the next incremental run can skip it
+        if snapshots and not self.dry_run:
+            snapshots.save(state_name + ":" + self._src_snapshot_name, self._pkgs_src[self._sourceSuite])
+            snapshots.save(state_name + ":" + self._dest_snapshot_name, self._pkgs_dest)
+            snapshots.save_state(state_name, {'policy': self._sync_policy_digest(), 'recheck': sorted(recheck)})
 
-def main():
-    # init Apt, we need it later
-    apt_pkg.init()
 
+def main():
     parser = OptionParser()
     parser.add_option("-i",
                   action="store_true", dest="import_pkg", default=False,
@@ -386,9 +441,16 @@ def main():
     parser.add_option("--quiet",
                   action="store_true", dest="quiet", default=False,
                   help="don't show output (except for errors)")
+    parser.add_option("--incremental",
+                  action="store_true", dest="incremental", default=False,
+                  help="only look at packages which changed since the last run (with --import-all)")
 
     (options, args) = parser.parse_args()
 
+    # init Apt, we need it later
+    apt_pkg.init()
+    start_run("synchrotron", RapidumoConfig())
+
     if options.import_pkg:
         sync = SyncPackage()
         if len(args) < 4:
@@ -427,7 +489,7 @@ def main():
         component = args[2]
         sync.initialize(source_suite, target_suite, component)
         sync.dry_run = options.dry_run
-        sync.sync_all_packages()
+        sync.sync_all_packages(options.incremental)
     elif options.import_set:
         if len(args) != 4:
             print("Invalid number of arguments (need source-suite, target-suite, component, set-name)")
@@ -16,38 +16,176 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
-import codecs
+import hashlib
+import tempfile
 from rapidumo.config import RapidumoConfig
-from jinja2 import Environment, FileSystemLoader
+from rapidumo.cache import cache_dir_from_config, file_digest
+from rapidumo.metrics import span, count
 
-# set up templates
 template_dir = os.path.dirname(os.path.realpath(__file__))
 template_dir = os.path.realpath(os.path.join(template_dir, "..", "templates"))
-j2_env = Environment(loader=FileSystemLoader(template_dir))
+
+# the template environment is set up when the first page is rendered
+_j2_env = None
+
+# rendered pages are written in chunks of about this many characters
+RENDER_BUFFER_SIZE = 256 * 1024
+
+# output directories we know to exist
+_output_dirs = set()
+
+# number of pages rendered by this process, and the ones which changed
+_pages_rendered = 0
+_pages_changed = list()
 
 # check if we are in debug mode
 debug_enabled = False
 if 'DEBUG' in os.environ:
     debug_enabled = True
 
+def get_template_env(config=None):
+    """
+     Return the Jinja2 environment for our templates. Compiled templates
+     are kept in the cache directory, if one is configured.
+    """
+    global _j2_env
+    if _j2_env:
+        return _j2_env
+
+    from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+    if not config:
+        config = RapidumoConfig()
+    bcc = None
+    cache = cache_dir_from_config(config, "jinja")
+    if cache:
+        bcc = FileSystemBytecodeCache(cache.path)
+    _j2_env = Environment(loader=FileSystemLoader(template_dir), bytecode_cache=bcc)
+    return _j2_env
+
+def write_file_atomic(fname, data):
+    """
+     Replace fname with data, so readers never see a partially written file.
+    """
+    fd, tmp_fname = tempfile.mkstemp(dir=os.path.dirname(fname), prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_fname, 0o644)
+        os.replace(tmp_fname, fname)
+    except Exception:
+        os.unlink(tmp_fname)
+        raise
+
+def file_has_digest(fname, size, digest):
+    try:
+        if os.path.getsize(fname) != size:
+            return False
+    except OSError:
+        return False
+    return file_digest(fname) == digest
+
+def file_has_content(fname, data):
+    return file_has_digest(fname, len(data), hashlib.sha256(data).hexdigest())
+
+def get_changed_pages():
+    """
+     Return the number of pages rendered by this process, and the paths
+     of those whose content changed.
+    """
+    return _pages_rendered, list(_pages_changed)
+
+def get_output_path(out_name, config=None):
+    """
+     Return the path of a file in the HTML output directory,
+     creating its subdirectories if necessary.
+    """
+    if not config:
+        config = RapidumoConfig()
+    out_path = os.path.join(config.general_config['html_output'], out_name)
+    out_dir = os.path.dirname(out_path)
+    if out_dir not in _output_dirs:
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+        _output_dirs.add(out_dir)
+    return out_path
+
+def write_output_file(out_name, content, config=None):
+    """
+     Write content (bytes) to a file in the HTML output directory. The file
+     is only written if its content changed, so it keeps its modification
+     time for HTTP caches and mirrors otherwise. Returns True if it was written.
+    """
+    global _pages_rendered
+    out_path = get_output_path(out_name, config)
+    _pages_rendered += 1
+    if file_has_content(out_path, content):
+        count("render.unchanged")
+        return False
+    write_file_atomic(out_path, content)
+    count("render.changed")
+    _pages_changed.append(out_path)
+    return True
+
+def write_output_stream(out_name, parts, config=None):
+    """
+     Like write_output_file(), but for content generated as a sequence of
+     strings, which is written out while it is generated. The new content is
+     hashed on the way, so we never need to hold all of it in memory.
+    """
+    global _pages_rendered
+    out_path = get_output_path(out_name, config)
+    fd, tmp_fname = tempfile.mkstemp(dir=os.path.dirname(out_path), prefix=".", suffix=".tmp")
+    try:
+        h = hashlib.sha256()
+        size = 0
+        with os.fdopen(fd, 'wb') as f:
+            # encoding lots of tiny strings is slow, so collect them first
+            buf = list()
+            buf_len = 0
+            for part in parts:
+                buf.append(part)
+                buf_len += len(part)
+                if buf_len < RENDER_BUFFER_SIZE:
+                    continue
+                data = "".join(buf).encode('utf-8')
+                h.update(data)
+                f.write(data)
+                size += len(data)
+                buf = list()
+                buf_len = 0
+            data = "".join(buf).encode('utf-8')
+            h.update(data)
+            f.write(data)
+            size += len(data)
+
+        _pages_rendered += 1
+        if file_has_digest(out_path, size, h.hexdigest()):
+            os.unlink(tmp_fname)
+            count("render.unchanged")
+            return False
+        os.chmod(tmp_fname, 0o644)
+        os.replace(tmp_fname, out_path)
+    except Exception:
+        if os.path.exists(tmp_fname):
+            os.unlink(tmp_fname)
+        raise
+    count("render.changed")
+    _pages_changed.append(out_path)
+    return True
+
 def render_template(name, out_name = None, *args, **kwargs):
+    """
+     Render a template into the HTML output directory, see write_output_file().
+     The page is streamed to disk as it is rendered, so large pages don't
+     need to fit into memory as a whole.
+    """
     config = RapidumoConfig()
-    gcfg = config.general_config
-    out_dir = gcfg['html_output']
-
     if not out_name:
-        out_path = os.path.join(out_dir, name)
-    else:
-        out_path = os.path.join(out_dir, out_name)
-    # create subdirectories if necessary
-    out_dir = os.path.dirname(os.path.realpath(out_path))
-    if not os.path.exists(out_dir):
-        os.makedirs(out_dir)
-
-    template = j2_env.get_template(name)
-    content = template.render(*args, **kwargs)
-    with codecs.open(out_path, 'w', encoding='utf-8') as f:
-        f.write(content)
+        out_name = name
+
+    with span("render"):
+        template = get_template_env(config).get_template(name)
+        return write_output_stream(out_name, template.generate(*args, **kwargs), config)
 
 def debug(text):
     if debug_enabled:
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2016 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+# Compare memory use and construction time of PackageInfo against the
+# old dict-based implementation, using a real Sources index:
+#   ./tools/bench-pkginfo.py /srv/debian-src/dists/unstable/main/source/Sources.gz
+#
+
+import os
+import sys
+import gc
+import gzip
+import time
+import tracemalloc
+from optparse import OptionParser
+
+root_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, root_dir)
+
+from apt_pkg import TagFile
+from rapidumo.pkginfo import PackageInfo, find_dsc
+
+
+class DictPackageInfo():
+    # the PackageInfo layout before it was made compact
+    def __init__(self, pkgname, pkgversion, suite, component, archs, directory, dsc):
+        self.pkgname = pkgname
+        self.version = pkgversion
+        self.suite = suite
+        self.component = component
+        self.archs = archs
+        self.binaries = []
+        self.installed_archs = []
+        self.directory = directory
+        self.dsc = dsc
+        self.build_depends = ""
+        self.build_conflicts = ""
+        self.maintainer = ""
+        self.comaintainers = ""
+        self.homepage = None
+        self.extra_source_only = False
+        self.queue_name = None
+
+
+def read_sections(fname):
+    # copy the raw field values, so both runs build from identical input
+    # and the TagFile overhead is not part of the measurement
+    sections = list()
+    with gzip.open(fname, 'rb') as f:
+        for section in TagFile(f):
+            sections.append((section['Package'], section['Version'], "unstable", "main",
+                             section['Architecture'], section['Directory'],
+                             find_dsc(section['Files']), section['Maintainer']))
+    return sections
+
+
+def bench(cls, sections):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    pkgs = list()
+    for name, version, suite, component, archs, directory, dsc, maint in sections:
+        pkg = cls(name, version, suite, component, archs, directory, dsc)
+        pkg.maintainer = sys.intern(maint) if cls is PackageInfo else maint
+        pkgs.append(pkg)
+    duration = time.perf_counter() - start
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duration, size
+
+
+def main():
+    parser = OptionParser(usage="%prog [options] SOURCES_GZ")
+    parser.add_option("-n",
+                  type="int", dest="rounds", default=5,
+                  help="number of rounds to run")
+
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        print("Need the path to a Sources.gz file!")
+        sys.exit(1)
+
+    sections = read_sections(args[0])
+    print("Loaded %i source packages." % (len(sections)))
+
+    for label, cls in [("dict", DictPackageInfo), ("slots", PackageInfo)]:
+        times = list()
+        for i in range(options.rounds):
+            duration, size = bench(cls, sections)
+            times.append(duration)
+        print("%-6s: %8.1f ms (best of %i), %8.2f MiB" % (label, min(times) * 1000,
+              options.rounds, size / (1024 * 1024)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2016 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+# Measure the startup time of our command-line tools, and check that
+# importing them doesn't pull in modules which should only be loaded
+# on demand (message bus, templates, YAML). Fails if a tool needs
+# longer than its budget to start:
+#   ./tools/bench-startup.py --runs 20
+#
+
+import os
+import sys
+import time
+import subprocess
+from optparse import OptionParser
+
+root_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# entry point script, module providing its main(), and the budget for
+# the median time of "--help" in ms. The medians measured with lazy
+# imports were 95 ms (rapidumo), 98 ms (synchrotron) and 89 ms (janitor),
+# with 18 ms for python3 itself; janitor needed 154 ms before.
+ENTRY_POINTS = [
+    ("rapidumo", "rapidumo.cli", 150),
+    ("synchrotron", "rapidumo.synchrotron.synccli", 150),
+    ("janitor", "rapidumo.janitor.janitorcli", 150),
+]
+
+# modules which must not be imported just by starting a tool
+LAZY_MODULES = ["fedmsg", "jinja2", "yaml", "sqlite3", "socketserver"]
+
+CHECK_IMPORTS = """
+import sys
+sys.path.insert(0, %r)
+import %s
+print(" ".join(m for m in %r if m in sys.modules))
+"""
+
+
+def time_help(script, runs):
+    cmd = [sys.executable, os.path.join(root_dir, "scripts", script), "--help"]
+    times = list()
+    for i in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call(cmd, stdout=subprocess.DEVNULL)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return times[0], times[len(times) // 2]
+
+
+def eager_imports(module):
+    code = CHECK_IMPORTS % (root_dir, module, LAZY_MODULES)
+    out = subprocess.check_output([sys.executable, "-c", code])
+    return str(out, 'utf-8').split()
+
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("--runs",
+                  type="int", dest="runs", default=10,
+                  help="number of times every tool is started")
+    parser.add_option("--budget-scale",
+                  type="float", dest="budget_scale", default=1.0,
+                  help="multiply the startup budgets by this factor, e.g. on slower machines")
+    (options, args) = parser.parse_args()
+
+    failed = False
+    start = time.perf_counter()
+    subprocess.check_call([sys.executable, "-c", "pass"])
+    print("python3 startup:   %8.1f ms" % ((time.perf_counter() - start) * 1000))
+    for script, module, budget in ENTRY_POINTS:
+        budget *= options.budget_scale
+        best, median = time_help(script, options.runs)
+        eager = eager_imports(module)
+        print("%-18s %8.1f ms (best), %8.1f ms (median), budget %.0f ms" % (script + ":", best, median, budget))
+        if eager:
+            print("  ERROR: imported at startup: %s" % (", ".join(eager)))
+            failed = True
+        if median > budget:
+            print("  ERROR: over the startup budget of %.0f ms" % (budget))
+            failed = True
+
+    if failed:
+        sys.exit(2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2016 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+# Compare apt_pkg.version_compare against the memoized version keys
+# when merging and sorting complete Sources indices:
+#   ./tools/bench-versions.py /srv/debian-src/dists/{testing,unstable}/main/source/Sources.xz
+# Without any index, only the known corner cases are checked.
+#
+
+import os
+import sys
+import time
+from functools import cmp_to_key
+from optparse import OptionParser
+
+root_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, root_dir)
+
+import apt_pkg
+from rapidumo.indexfile import iter_index_sections
+from rapidumo.debversion import version_key, compare_versions
+
+# version pairs which were ordered differently from dpkg at some point
+CORNER_CASES = [
+    ("1.0", "1.0-0"),
+    ("1.0-0", "1.0-0~exp1"),
+    ("0", "0~rc1"),
+    ("1.0-0", "1.0-0.1"),
+    ("1.0-0", "1.0-"),
+    ("1.0-0~", "1.0"),
+    ("0~", ""),
+    ("1.00", "1.0~"),
+    ("1.0~rc1", "1.0"),
+    ("1.0~~", "1.0~"),
+    ("1.0a", "1.0+"),
+    ("1.0.0", "1.0"),
+    ("1:0", "0:1"),
+    ("2:1.0-1", "1:2.0-1"),
+]
+
+
+def check_corner_cases():
+    failed = False
+    for a, b in CORNER_CASES:
+        for x, y in [(a, b), (b, a)]:
+            expected = apt_pkg.version_compare(x, y)
+            expected = (expected > 0) - (expected < 0)
+            if compare_versions(x, y) != expected:
+                print("ERROR: %s vs %s: got %i, apt says %i" % (x, y, compare_versions(x, y), expected))
+                failed = True
+    return not failed
+
+
+def merge_compare(records):
+    pkg_dict = {}
+    for name, version in records:
+        if name in pkg_dict:
+            if apt_pkg.version_compare(pkg_dict[name], version) >= 0:
+                continue
+        pkg_dict[name] = version
+    return pkg_dict
+
+
+def merge_key(records):
+    pkg_dict = {}
+    for name, version in records:
+        if name in pkg_dict:
+            if version_key(pkg_dict[name]) >= version_key(version):
+                continue
+        pkg_dict[name] = version
+    return pkg_dict
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    res = func(*args)
+    return (time.perf_counter() - start) * 1000, res
+
+
+def main():
+    parser = OptionParser(usage="%prog [SOURCES...]")
+    (options, args) = parser.parse_args()
+
+    apt_pkg.init()
+    if not check_corner_cases():
+        sys.exit(2)
+    print("Checked %i corner cases." % (len(CORNER_CASES)))
+    if not args:
+        return
+
+    records = list()
+    for fname in args:
+        for section in iter_index_sections(fname):
+            records.append((section['Package'], section['Version']))
+    versions = [r[1] for r in records]
+    print("Loaded %i source packages." % (len(records)))
+
+    t, res_cmp = timed(merge_compare, records)
+    print("merge, version_compare: %8.1f ms" % (t))
+    version_key.cache_clear()
+    t, res_key = timed(merge_key, records)
+    print("merge, version_key:     %8.1f ms (cold)" % (t))
+    t, res_key = timed(merge_key, records)
+    print("merge, version_key:     %8.1f ms (warm)" % (t))
+    if res_cmp != res_key:
+        print("ERROR: merge results differ!")
+        sys.exit(2)
+
+    t, sorted_cmp = timed(sorted, versions, key=cmp_to_key(apt_pkg.version_compare))
+    print("sort, version_compare:  %8.1f ms" % (t))
+    version_key.cache_clear()
+    t, sorted_key = timed(sorted, versions, key=version_key)
+    print("sort, version_key:      %8.1f ms (cold)" % (t))
+    if [version_key(v) for v in sorted_cmp] != [version_key(v) for v in sorted_key]:
+        print("ERROR: sort results differ!")
+        sys.exit(2)
+
+if __name__ == '__main__':
+    main()
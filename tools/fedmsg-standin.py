@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2016 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+# A local ZeroMQ endpoint standing in for the message bus, to try the
+# background message emitter without a fedmsg setup:
+#   ./tools/fedmsg-standin.py listen tcp://127.0.0.1:4000
+#   ./tools/fedmsg-standin.py emit tcp://127.0.0.1:4000 --count 5000 --slow 20
+#
+
+import os
+import sys
+import json
+import time
+from optparse import OptionParser
+
+root_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, root_dir)
+
+import zmq
+from rapidumo.messaging import MessageEmitter
+
+
+def listen(endpoint):
+    ctx = zmq.Context()
+    sock = ctx.socket(zmq.SUB)
+    sock.setsockopt(zmq.SUBSCRIBE, b"")
+    sock.bind(endpoint)
+    print("Listening on %s" % (endpoint))
+    count = 0
+    try:
+        while True:
+            topic, body = sock.recv_multipart()
+            count += 1
+            msg = json.loads(str(body, 'utf-8'))
+            print("%s: %s" % (str(topic, 'utf-8'), msg['msg']))
+    except KeyboardInterrupt:
+        print("Received %i messages." % (count))
+
+
+def emit(endpoint, options):
+    ctx = zmq.Context()
+    sock = ctx.socket(zmq.PUB)
+    sock.connect(endpoint)
+    # give the subscriber time to connect
+    time.sleep(0.5)
+
+    def publish(modname, topic, message):
+        if options.slow:
+            time.sleep(options.slow / 1000)
+        full_topic = "org.tanglu.dev.%s.%s" % (modname, topic)
+        body = {'topic': full_topic, 'msg': message, 'timestamp': time.time()}
+        sock.send_multipart([full_topic.encode('utf-8'), json.dumps(body).encode('utf-8')])
+
+    emitter = MessageEmitter(publish, queue_size=options.queue_size, block_timeout=options.block_timeout)
+    start = time.perf_counter()
+    for i in range(options.count):
+        topic = "done" if i % 10 else "error"
+        emitter.emit("synchrotron.import", topic, "Synced package pkg%i-1.0-1 from Debian." % (i))
+    emitted = time.perf_counter() - start
+    emitter.close()
+    total = time.perf_counter() - start
+
+    print("emitted %i messages in %.1f ms, flushed after %.1f ms" % (options.count, emitted * 1000, total * 1000))
+    for key, value in sorted(emitter.get_stats().items()):
+        print("  %-10s %i" % (key + ":", value))
+
+
+def main():
+    parser = OptionParser(usage="%prog [options] listen|emit ENDPOINT")
+    parser.add_option("--count",
+                  type="int", dest="count", default=1000,
+                  help="number of messages to emit")
+    parser.add_option("--slow",
+                  type="float", dest="slow", default=0,
+                  help="milliseconds every publish takes, to simulate a slow bus")
+    parser.add_option("--queue-size",
+                  type="int", dest="queue_size", default=1000,
+                  help="size of the emitter queue")
+    parser.add_option("--block-timeout",
+                  type="float", dest="block_timeout", default=0,
+                  help="seconds to wait for queue space before dropping a message")
+    (options, args) = parser.parse_args()
+    if len(args) != 2:
+        print("Need a command and a ZeroMQ endpoint!")
+        sys.exit(1)
+
+    if args[0] == "listen":
+        listen(args[1])
+    elif args[0] == "emit":
+        emit(args[1], options)
+    else:
+        print("Unknown command: %s" % (args[0]))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()